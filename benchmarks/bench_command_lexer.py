@@ -0,0 +1,98 @@
+"""Compares `core.nut.lexer.lex_arguments` against the old regex command parser.
+
+Run from the repository root: ``python -m benchmarks.bench_command_lexer``
+"""
+import re
+import timeit
+
+from core.nut.lexer import lex_arguments
+from core.nut.error import ParameterParseException
+
+# command content as it reaches CommandNut (prefix and keyword already stripped)
+CORPUS = [
+    '',
+    'forsen',
+    'kind',
+    '-_ch forsen',
+    '-_ch xqc -_sybau',
+    'cruel 0.4 0.05 0.6 0.1',
+    'hello world this is an echo with a bunch of words in it',
+    'x_  b\xa0 tab\tsep',
+    'a "" b',
+    '"',
+    '"hi',
+    'say "an unterminated quote',
+    'x -m "open',
+    '"The Pyramid of Cestius is in Rome." "Khufu\'s pyramid was the tallest structure for 3800 years."',
+    '"a fact with \\"escaped quotes\\" inside" "and a back\\\\slash"',
+    ' '.join(f'"Fact number {i}: pyramids have {i} blocks, give or take a few million."' for i in range(30)),
+    ' '.join(f'"Fact {i} with an \\"escaped\\" quote"' for i in range(30)),
+]
+
+#                    quoted arg (\ esc chr)   | named par       | regular arg
+_legacy_regex = r"""(".*?[^\\](?:\\\\)*(?=")")|(-[a-zA-z]\S*.*?)|(\S+.*?)"""
+
+def _legacy_escape(string: str) -> str:
+    result = []
+    i = 0
+    while True:
+        idx = string.find('\\', i)
+        if idx == -1:
+            result.append(string[i:])
+            break
+        result.append(string[i:idx])
+        if idx == len(string) - 1:
+            break
+        result.append(string[idx+1])
+        i = idx+2
+    return ''.join(result)
+
+def legacy_parse(content: str):
+    matches = re.findall(_legacy_regex, content)
+    res = []
+    for arg in matches:
+        res.append(next((x, _legacy_escape(y)) for x, y in enumerate(arg) if y != ''))
+
+    args = []
+    kwargs = {}
+
+    parameter = None
+    had_parameter = False
+    for argtype, argvalue in res:
+        match argtype:
+            case 0 | 2:
+                value = argvalue
+                if argtype == 0:
+                    value = value[1:-1]
+                if parameter is not None:
+                    kwargs[parameter] = value
+                    parameter = None
+                elif had_parameter:
+                    raise ParameterParseException()
+                else:
+                    args.append(value)
+            case 1:
+                value = argvalue[1:]
+                parameter = value
+                kwargs[parameter] = True
+                had_parameter = True
+
+    awargs = {x: kwargs.pop(x) for x in list(kwargs.keys()) if x.startswith("_")}
+    return args, kwargs, awargs
+
+def main(number: int = 2_000):
+    for line in CORPUS:
+        assert lex_arguments(line) == legacy_parse(line), line
+
+    print(f"{'chars':>6} {'regex μs':>10} {'lexer μs':>10} {'speedup':>8}")
+    totals = [0.0, 0.0]
+    for line in CORPUS:
+        legacy = timeit.timeit(lambda: legacy_parse(line), number=number) / number * 1e6
+        lexer  = timeit.timeit(lambda: lex_arguments(line), number=number) / number * 1e6
+        totals[0] += legacy
+        totals[1] += lexer
+        print(f"{len(line):>6} {legacy:>10.2f} {lexer:>10.2f} {legacy / lexer:>7.2f}x")
+    print(f"{'total':>6} {totals[0]:>10.2f} {totals[1]:>10.2f} {totals[0] / totals[1]:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Compares `core.utils.pyramid.PyramidDetector` against the old PyramidAcorn detection.
+
+Replays a chat log of pyramids mixed with regular traffic through both.
+Run from the repository root: ``python -m benchmarks.bench_pyramid_detector``
+"""
+import random
+import timeit
+
+from core.utils.pyramid import PyramidDetector, STEP
+
+REQ_LEVEL = 3
+
+def pyramid(user: str, emote: str, height: int) -> list[tuple[str, str]]:
+    levels = list(range(1, height + 1)) + list(range(height - 1, 0, -1))
+    return [(user, ' '.join([emote] * level)) for level in levels]
+
+def chat_log(lines: int = 20_000, seed: int = 1) -> list[tuple[str, str]]:
+    rng = random.Random(seed)
+    words = "LUL KEKW Pog Kappa KappaPride PogChamp monkaS OMEGALUL catJAM forsenE what is this chat right now no way he did that again".split()
+    users = [f"chatter{i}" for i in range(300)]
+    log = []
+    while len(log) < lines:
+        if rng.random() < 0.01:
+            log.extend(pyramid(rng.choice(users), rng.choice(words[:10]), rng.randint(3, 6)))
+        else:
+            log.append((rng.choice(users), ' '.join(rng.choice(words) for _ in range(rng.randint(1, 12)))))
+    return log
+
+def _legacy_count(str1):
+    obj = {}
+    for el in str1.split(" "):
+        obj[el] = obj.get(el, 0) + 1
+    return obj
+
+class LegacyDetector():
+    # old PyramidAcorn.test_pyramid with the side effects stripped out
+
+    def __init__(self):
+        self.reset('', '')
+
+    def reset(self, user, msg):
+        self.last_user = user
+        self.last_message = msg
+        self.level = 0
+        self.max_level = 0
+        self.pyramid = ''
+
+    def feed(self, user, message, req_level):
+        if user != self.last_user:
+            step = STEP.BROKEN if self.max_level >= req_level else STEP.RESET
+            self.reset(user, message)
+            return step
+
+        if self.level == 0:
+            new_words = _legacy_count(message)
+            old_words = _legacy_count(self.last_message)
+            for x, y in new_words.items():
+                if y == 2 and x in old_words and old_words[x] == 1:
+                    self.level = self.max_level = y
+                    self.pyramid = x
+                    return STEP.STARTED
+            self.reset(user, message)
+            return STEP.RESET
+
+        occurences = len(message.split(self.pyramid)) - 1
+        dif = occurences - self.level
+
+        if dif == 1 and self.level == self.max_level:
+            self.level = self.max_level = occurences
+            return STEP.UP
+
+        if dif == -1 and self.max_level >= req_level:
+            self.level = occurences
+            if self.level == 1:
+                self.reset(user, message)
+                return STEP.COMPLETE
+            return STEP.DOWN
+
+        self.reset(user, message)
+        return STEP.RESET
+
+def replay(detector, log) -> int:
+    completed = 0
+    for user, message in log:
+        if detector.feed(user, message, REQ_LEVEL) is STEP.COMPLETE:
+            completed += 1
+    return completed
+
+def main(number: int = 5):
+    log = chat_log()
+    legacy_done = replay(LegacyDetector(), log)
+    engine_done = replay(PyramidDetector(), log)
+    print(f"completed pyramids ▲ legacy: {legacy_done} ▲ detector: {engine_done}")
+
+    substring = pyramid("chatter", "Kappa", 3)
+    substring[1] = ("chatter", "Kappa KappaPride")
+    print(f"'Kappa KappaPride' counted as level ▲ legacy: 2 ▲ detector: {1 if replay(PyramidDetector(), substring) == 0 else 2}")
+
+    legacy = min(timeit.repeat(lambda: replay(LegacyDetector(), log), number=1, repeat=number)) / len(log) * 1e6
+    engine = min(timeit.repeat(lambda: replay(PyramidDetector(), log), number=1, repeat=number)) / len(log) * 1e6
+    print(f"per message ▲ legacy: {legacy:.2f}μs ▲ detector: {engine:.2f}μs ▲ {legacy / engine:.2f}x")
+
+    climbing = pyramid("chatter", "forsenE", 40)
+    legacy = min(timeit.repeat(lambda: replay(LegacyDetector(), climbing), number=200, repeat=number)) / 200 / len(climbing) * 1e6
+    engine = min(timeit.repeat(lambda: replay(PyramidDetector(), climbing), number=200, repeat=number)) / 200 / len(climbing) * 1e6
+    print(f"per message in a 40 high pyramid ▲ legacy: {legacy:.2f}μs ▲ detector: {engine:.2f}μs ▲ {legacy / engine:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -21,11 +21,28 @@ class Acorn():
         logging = get_log(self.__module__)
         for _, method in inspect.getmembers(self):
             if isinstance(method, Nut):
+                method.compile_policies()
                 details = method.register(self, bot)
                 logging.info(f"Loaded <{method.__class__.__name__}> [{method.fullname}] {details}")
 
                 self._nuts[method.fullname] = method
 
+    async def warmup(self, bot: 'Bot') -> None:
+        # hook for acorns to fill their caches once the bot is connected
+        ...
+
+    async def channels_joined(self, bot: 'Bot', channels: list[str]) -> None:
+        # hook for acorns to load what they need for channels the bot starts carrying after boot
+        ...
+
+    async def channels_parted(self, bot: 'Bot', channels: list[str]) -> None:
+        # hook for acorns to drop what they kept for channels the bot no longer carries
+        ...
+
+    async def shutdown(self, bot: 'Bot') -> None:
+        # hook for acorns to persist their state before the bot closes
+        ...
+
     def unload_nuts(self, bot) -> None:
         for fullname in self._nuts:
             bot.remove_nut(fullname)
@@ -3,7 +3,6 @@ import asyncio
 import datetime as dt
 from typing import TYPE_CHECKING
 import os
-from collections import deque
 
 import psutil
 from twitchio.ext import commands
@@ -11,13 +10,20 @@ from twitchio.ext import commands
 from core.acorn.base import Acorn
 from core.utils.logger import get_log
 from core.utils.timeit import TimeThis
-from core.utils.units import strfdelta, strfbytes
+from core.utils.units import strfdelta, strfbytes, strpdelta
+from core.utils.timeseries import MetricStore
+from core.utils.startup import timeline
 from core.utils.graph import generate_graph_string
 from core.nut.nut import CommandNut, DEFAULT_ALIAS, CronNut
-from core.nut.error import MissingDataException
+from core.nut.error import MissingDataException, ParameterParseException
 from core.nut.result import ECODE, Result
 from core.nut.restrictions import cooldown, PRIVILEDGE, channel, restrict, get_priviledge
-from core.config import BOTNAME
+from core.database.writer import BufferedWriter
+from core.database.sql import engine, UnitOfWork
+from core.utils.metrics import NutMetrics, prometheus_text, write_atomic
+from core.pipeline.outbound import SEND_PRIORITY
+from core.pipeline.tracing import Tracer, append_lines
+from core.config import BOTNAME, METRICS, TRACING
 
 if TYPE_CHECKING:
     from core.bot import Bot
@@ -29,20 +35,71 @@ class MetaAcorn(Acorn):
     _name = 'meta'
     _tag_workers: dict[str, asyncio.Event] = {}
 
-    # 2h
-    latency_hist   = deque([dt.timedelta()] * 120, 120)
-    cpu_usage_hist = deque([0]              * 120, 120)
-    mem_usage_hist = deque([0]              * 120, 120)
-    beat           = False
+    beat = False
+
+    # metric -> (formatter, aggregate shown in graphs: 1 min, 2 avg, 3 max)
+    _series = {
+        'latency' : (strfdelta, 2),
+        'alloc'   : (strfbytes, 2),
+        'cpu'     : (str,       2),
+        'lag'     : (strfdelta, 3), # worst event loop lag
+        'queued'  : (str,       3), # messages waiting in the dispatcher
+        'outbound': (str,       3), # PRIVMSGs waiting for the rate limits
+    }
 
     def __init__(self, bot: 'Bot'):
         super().__init__()
 
         bot.add_event(self._pong_handler, "event_pong")
 
+        self.timeseries = MetricStore()
+        self._process = psutil.Process(os.getpid())
+        self._sampler: asyncio.Task = None
+
         # throw away first measured period's percentage
         psutil.cpu_percent()
 
+    async def warmup(self, bot: 'Bot') -> None:
+        path = METRICS.get('history_file')
+        series = await asyncio.to_thread(self.timeseries.read, path) if path else None
+        if series is not None:
+            # WHY: swapped in on the loop, the heartbeat may be adding to the live series meanwhile
+            self.timeseries.series.update(series)
+            logging.info(f"metric history loaded from {path}")
+        if self._sampler is None:
+            self._sampler = asyncio.get_running_loop().create_task(self._sample(bot))
+
+    async def shutdown(self, bot: 'Bot') -> None:
+        if self._sampler is not None:
+            self._sampler.cancel()
+            self._sampler = None
+        await self.save_history()
+
+    async def _sample(self, bot: 'Bot'):
+        # NOTE: every second, twitch latency is only measured by the heartbeat
+        while True:
+            await asyncio.sleep(1)
+            try:
+                self.timeseries.add('alloc', self._process.memory_info().rss)
+                self.timeseries.add('cpu', psutil.cpu_percent())
+                self.timeseries.add('lag', bot.watchdog.pop_max())
+                self.timeseries.add('queued', bot.dispatcher.total_depth)
+                self.timeseries.add('outbound', bot.outbound.depth)
+            except Exception:
+                logging.exception("metric sampling failed")
+
+    async def save_history(self):
+        path = METRICS.get('history_file')
+        if path:
+            await asyncio.to_thread(self.timeseries.save, path, self.timeseries.dump())
+
+    def _graph(self, name: str, window: float) -> tuple[str, str]:
+        fmt, agg = self._series.get(name, (str, 2))
+        _, points = self.timeseries[name].query(window)
+        if not points:
+            return "no data", "none"
+        return generate_graph_string([x[agg] for x in points], cbfmt=fmt), fmt(points[-1][agg])
+
     async def _pong_handler(self, parsed: dict):
         tag = self._tag_workers.pop(parsed['message'], None)
         if tag:
@@ -67,8 +124,7 @@ class MetaAcorn(Acorn):
 
     async def _ping(self, ctx: commands.Context):
         time   = await self._twitch_ping(ctx)
-        pid = os.getpid()
-        mem_usage = psutil.Process(pid).memory_info().rss # bytes
+        mem_usage = self._process.memory_info().rss # bytes
         cpu_perc = psutil.cpu_percent()
 
         return {
@@ -93,9 +149,8 @@ class MetaAcorn(Acorn):
     async def heartbeat(self, ctx: commands.Context):
         stats = await self._ping(ctx)
 
-        self.latency_hist.append(stats['latency'])
-        self.mem_usage_hist.append(stats['alloc'])
-        self.cpu_usage_hist.append(stats['cpu'])
+        if isinstance(stats['latency'], dt.timedelta):
+            self.timeseries.add('latency', stats['latency'].total_seconds())
 
         self.beat = True
 
@@ -107,17 +162,48 @@ class MetaAcorn(Acorn):
         if not self.beat:
             await self.heartbeat.actuate()
 
-        uptime  = strfdelta(dt.datetime.now() - ctx.bot.start_time)
-        latency = strfdelta(self.latency_hist[-1])
-        alloc   = strfbytes(self.mem_usage_hist[-1])
-        cpu     = str(self.cpu_usage_hist[-1])
+        uptime = strfdelta(dt.datetime.now() - ctx.bot.start_time)
+        window = 2 * 3_600
+        lines  = [f"fullpong ▲ uptime: {uptime}"]
+        for name, label in (('latency', 'latency'), ('alloc', 'alloc'), ('cpu', 'cpu'), ('lag', 'loop lag')):
+            graph, latest = self._graph(name, window)
+            lines.append(f"fullpong ▲ {label} ▲ 2h hist: {graph} latest: {latest}")
+        lines[-1] += f" ▲ stalls: {ctx.bot.watchdog.stalls}"
+        return Result(ECODE.OK, lines)
 
-        return Result(ECODE.OK, [
-            f"fullpong ▲ uptime: {uptime}",
-            f"fullpong ▲ latency ▲ 2h hist: {generate_graph_string([x.total_seconds() for x in self.latency_hist], cbfmt=strfdelta)} latest: {latency}",
-            f"fullpong ▲ alloc ▲ 2h hist: {generate_graph_string(self.mem_usage_hist, cbfmt=strfbytes)} latest: {alloc}",
-            f"fullpong ▲ cpu ▲ 2h hist: {generate_graph_string(self.cpu_usage_hist, cbfmt=str)} latest: {cpu}",
-        ])
+    @cooldown(10)
+    @CommandNut(default_aliases=DEFAULT_ALIAS.FULLNAME_ONLY)
+    async def history(self, ctx: commands.Context, metric: str, window: str = '2h'):
+        if metric not in self._series:
+            raise MissingDataException(f"unknown metric '{metric}', try one of: {', '.join(self._series)}")
+        try:
+            seconds = strpdelta(window)
+        except ValueError as e:
+            raise ParameterParseException(str(e))
+
+        fmt, _ = self._series[metric]
+        resolution, points = self.timeseries[metric].query(seconds)
+        if not points:
+            return Result(ECODE.OK, f"history {metric} ▲ {window} ▲ no data")
+        graph, latest = self._graph(metric, seconds)
+        low  = min(x[1] for x in points)
+        high = max(x[3] for x in points)
+        avg  = sum(x[2] for x in points) / len(points)
+        return Result(ECODE.OK, f"history {metric} ▲ {window} at {strfdelta(resolution)} ▲ {graph} ▲ min: {fmt(low)} avg: {fmt(avg)} max: {fmt(high)} ▲ latest: {latest}")
+
+    @cooldown(10)
+    @CommandNut(default_aliases=DEFAULT_ALIAS.FULLNAME_ONLY)
+    async def pipeline(self, ctx: commands.Context, channel: str = None):
+        tracer = ctx.bot.tracer
+        lines = []
+        for key in (channel or ctx.channel.name, Tracer.ALL):
+            stats = tracer.percentiles(key.lower(), 0.5, 0.99)
+            if stats is None:
+                lines.append(f"pipeline #{key} ▲ no traffic traced yet")
+                continue
+            stages = ' ▲ '.join(f"{stage}: {strfdelta(p50)}/{strfdelta(p99)}" for stage, (p50, p99) in stats.items())
+            lines.append(f"pipeline {'all channels' if key == Tracer.ALL else '#' + key} ▲ p50/p99 ▲ {stages}")
+        return Result(ECODE.OK, lines)
 
     @channel([BOTNAME])
     @CommandNut()
@@ -149,4 +235,121 @@ class MetaAcorn(Acorn):
     @CommandNut()
     async def echo(self, ctx: commands.Context):
         logging.info(f"#{ctx.channel.name} echoed @{ctx.author.name}'s '{ctx.message.content}'")
-        return Result(ECODE.OK, ctx.message.content)
\ No newline at end of file
+        return Result(ECODE.OK, ctx.message.content)
+
+    @restrict(PRIVILEDGE.ADMIN)
+    @CommandNut(default_aliases=DEFAULT_ALIAS.FULLNAME_ONLY)
+    async def writers(self, ctx: commands.Context):
+        lines = []
+        for writer in BufferedWriter.writers.values():
+            latency = max(writer.flush_latency, default=0)
+            last    = writer.flush_latency[-1] if writer.flush_latency else 0
+            lines.append(f"writer {writer.name} ▲ depth: {writer.depth} ▲ written: {writer.flushed} ▲ failed flushes: {writer.failed} ▲ dropped: {writer.dropped} ▲ flush: {strfdelta(last)} (max {strfdelta(latency)}) ▲ {writer.rows_per_second:.0f} rows/s")
+        if not lines:
+            return Result(ECODE.OK, "no writers registered")
+        return Result(ECODE.OK, lines)
+
+    @restrict(PRIVILEDGE.ADMIN)
+    @CommandNut(default_aliases=DEFAULT_ALIAS.FULLNAME_ONLY)
+    async def pool(self, ctx: commands.Context):
+        pool = engine.pool
+        return Result(ECODE.OK, f"db pool ▲ size: {pool.size()} ▲ in use: {pool.checkedout()} ▲ idle: {pool.checkedin()} ▲ overflow: {max(0, pool.overflow())} ▲ units of work: {UnitOfWork.committed} committed, {UnitOfWork.rolled_back} rolled back")
+
+    @restrict(PRIVILEDGE.ADMIN)
+    @CommandNut(default_aliases=DEFAULT_ALIAS.FULLNAME_ONLY)
+    async def queues(self, ctx: commands.Context):
+        dispatcher = ctx.bot.dispatcher
+        admission  = ctx.bot.admission
+        lagging = ' '.join(f"#{channel}: {depth} (max {dispatcher.high_water.get(channel, 0)}, dropped {dispatcher.dropped.get(channel, 0)})" for channel, depth in dispatcher.lagging())
+        shed    = ' '.join(f"#{channel}: {count} (sampled {admission.sampled.get(channel, 0)})" for channel, count in admission.most_shed())
+        return Result(ECODE.OK, [
+            f"queues ▲ total depth: {dispatcher.total_depth} ▲ dropped: {sum(dispatcher.dropped.values())} ▲ lagging: {lagging or 'none'}",
+            f"queues ▲ shed: {admission.total_shed} ▲ most shed: {shed or 'none'}",
+        ])
+
+    @restrict(PRIVILEDGE.ADMIN)
+    @CommandNut(default_aliases=DEFAULT_ALIAS.FULLNAME_ONLY)
+    async def outbound(self, ctx: commands.Context):
+        outbound = ctx.bot.outbound
+        lines = [f"outbound ▲ queued: {outbound.depth}"]
+        for priority in SEND_PRIORITY:
+            waits = sorted(outbound.wait_times[priority])
+            p50 = waits[len(waits) // 2] if waits else 0
+            p99 = waits[int(len(waits) * 0.99)] if waits else 0
+            lines.append(f"outbound {priority.name.lower()} ▲ sent: {outbound.sent[priority]} ▲ expired: {outbound.expired[priority]} ▲ wait p50: {strfdelta(p50)} p99: {strfdelta(p99)}")
+        return Result(ECODE.OK, lines)
+
+    @restrict(PRIVILEDGE.ADMIN)
+    @CommandNut(default_aliases=DEFAULT_ALIAS.FULLNAME_ONLY)
+    async def startup(self, ctx: commands.Context):
+        phases = ' ▲ '.join(f"{name}: {strfdelta(seconds)}" for name, seconds in timeline.phases.items())
+        marks  = ' ▲ '.join(f"{name}: {strfdelta(seconds)}" for name, seconds in timeline.marks.items())
+        return Result(ECODE.OK, [
+            f"startup ▲ phases ▲ {phases or 'none'}",
+            f"startup ▲ since process start ▲ {marks or 'none'}",
+        ])
+
+    @restrict(PRIVILEDGE.ADMIN)
+    @CommandNut(default_aliases=DEFAULT_ALIAS.FULLNAME_ONLY)
+    async def joins(self, ctx: commands.Context):
+        joins = ctx.bot.joins
+        failed = ' '.join(sorted(joins.failed))
+        return Result(ECODE.OK, f"joins ▲ joined: {len(joins.joined)}/{len(joins.wanted)} ▲ pending: {len(joins.pending)} ▲ queued: {joins.queued} ▲ eta: {strfdelta(joins.eta())} ▲ failed: {len(joins.failed)} {failed}".rstrip())
+
+    @restrict(PRIVILEDGE.ADMIN)
+    @CommandNut(default_aliases=DEFAULT_ALIAS.FULLNAME_ONLY)
+    async def delivery(self, ctx: commands.Context, channel: str = None):
+        tracker = ctx.bot.delivery
+        tracker.expire()
+        lines = []
+        if channel is not None:
+            selected = [(channel.lower(), tracker.channel(channel.lower()))]
+        else: # worst first
+            selected = tracker.worst()
+            sent     = sum(x.sent for _, x in tracker.items())
+            rejected = sum(x.rejected for _, x in tracker.items())
+            silent   = sum(x.silent for _, x in tracker.items())
+            lines.append(f"delivery ▲ sent: {sent} ▲ rejected: {rejected} ▲ silently dropped: {silent}")
+        for name, stats in selected:
+            p50, p99 = stats.latency.percentiles(0.5, 0.99)
+            reasons = ' '.join(f"{reason}: {count}" for reason, count in stats.reasons.items())
+            lines.append(f"delivery #{name} ▲ sent: {stats.sent} ▲ ack p50: {strfdelta(p50)} p99: {strfdelta(p99)} ▲ dropped: {stats.drop_rate:.1%} (rejected {stats.rejected}, silent {stats.silent}) {reasons}".rstrip())
+        return Result(ECODE.OK, lines)
+
+    @restrict(PRIVILEDGE.ADMIN)
+    @CommandNut(default_aliases=DEFAULT_ALIAS.FULLNAME_ONLY)
+    async def nuts(self, ctx: commands.Context, fullname: str = None):
+        if fullname is not None:
+            selected = [NutMetrics.registry[fullname]] if fullname in NutMetrics.registry else []
+        else: # slowest first
+            selected = sorted(NutMetrics.registry.values(), key=lambda x: x.latency.percentiles(0.99)[0], reverse=True)[:5]
+        if not selected:
+            return Result(ECODE.OK, "no nut actuated yet")
+
+        lines = []
+        for metrics in selected:
+            p50, p95, p99 = metrics.latency.percentiles(0.5, 0.95, 0.99)
+            codes = ' '.join(f"{code.name.lower()}: {count}" for code, count in metrics.codes.items() if count)
+            lines.append(f"nut {metrics.fullname} ▲ p50: {strfdelta(p50)} p95: {strfdelta(p95)} p99: {strfdelta(p99)} ▲ {codes}")
+        return Result(ECODE.OK, lines)
+
+    @CronNut('*/5 * * * *')
+    async def history_save(self, ctx: commands.Context):
+        await self.save_history()
+        return Result(ECODE.SILENT, None)
+
+    @CronNut('*/1 * * * *')
+    async def metrics_dump(self, ctx: commands.Context):
+        ctx.bot.delivery.expire() # also reports messages twitch never answered
+        path = METRICS.get('file')
+        if path:
+            await asyncio.to_thread(write_atomic, path, prometheus_text())
+        return Result(ECODE.SILENT, None)
+
+    @CronNut('*/1 * * * *')
+    async def trace_dump(self, ctx: commands.Context):
+        lines = ctx.bot.tracer.drain_slow()
+        path = TRACING.get('file')
+        if path and lines:
+            await asyncio.to_thread(append_lines, path, lines)
+        return Result(ECODE.SILENT, None)
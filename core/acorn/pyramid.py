@@ -1,6 +1,9 @@
 from random import random
+from contextlib import asynccontextmanager
+import asyncio
 import math
 import datetime as dt
+from typing import TYPE_CHECKING
 
 from twitchio.ext import commands
 from sqlalchemy.orm import Mapped, mapped_column
@@ -13,7 +16,15 @@ from core.nut.nut import RegexNut, CommandNut, DEFAULT_ALIAS
 from core.nut.restrictions import restrict, PRIVILEDGE
 from core.nut.error import MissingDataException
 from core.utils.logger import get_log
-from core.database.sql import Base, create_session
+from core.utils.lru import LRUStore
+from core.utils.pyramid import PyramidDetector, STEP
+from core.utils.units import strfbytes
+from core.database.sql import Base, create_session, run_sync, unit_of_work
+from core.database.writer import BufferedWriter
+from core.pipeline.outbound import SEND_PRIORITY
+
+if TYPE_CHECKING:
+    from core.bot import Bot
 
 logging = get_log(__name__)
 
@@ -58,12 +69,6 @@ default_facts = [
     "Shungite pyramids are said to possess numerous effects, such as EMF protection, healing properties and energy balancing.",
 ]
 
-def count(str1):
-    obj = {}
-    for el in str1.split(" "):
-        obj[el] = obj.get(el, 0) + 1
-    return obj
-
 class PyramidData(Base):
     __tablename__ = "acorn_pyramid_data"
 
@@ -100,6 +105,34 @@ class PyramidData(Base):
             data = query()
         return data
 
+    @classmethod
+    async def aget_data(cls, user_name) -> 'PyramidData':
+        return await run_sync(cls.get_data, user_name)
+
+    @classmethod
+    def preload(cls, channels: list[str]) -> dict[str, 'PyramidData']:
+        # one query for every known config, one bulk insert for the missing defaults
+        if not channels:
+            return {}
+        with create_session(expire_on_commit=False) as session:
+            stmt = select(PyramidData).where(PyramidData.user_name.in_(channels))
+            data = {x.user_name: x for x in session.scalars(stmt)}
+
+            missing = [channel for channel in channels if channel not in data]
+            if missing:
+                rows = [{'user_name': channel, 'active': False, 'profile': 'kind', 'facts': default_facts} for channel in missing]
+                stats = PyramidData.bulk_create_or_update(rows, update=[], returning=True, session=session)
+                data.update({x.user_name: x for x in stats.returned})
+                session.commit()
+        return data
+
+    @classmethod
+    async def apreload(cls, channels: list[str]) -> dict[str, 'PyramidData']:
+        return await run_sync(cls.preload, channels)
+
+# NOTE: pyramid results come in bursts and nobody reads them back right away
+pyramid_results = BufferedWriter("acorn_pyramid_user", copy=True)
+
 class PyramidUserData(Base):
     __tablename__ = "acorn_pyramid_user"
 
@@ -114,25 +147,25 @@ class PyramidUserData(Base):
 
     @classmethod
     def save_loss(cls, channel_name, user_name, level, pyramid, destroyer_name):
-        PyramidUserData(
+        pyramid_results.put(PyramidUserData(
             channel_name = channel_name,
             user_name = user_name,
             success = False,
             level = level,
             pyramid = pyramid,
             destroyer_name = destroyer_name,
-        ).create()
+        ))
 
     @classmethod
     def save_win(cls, channel_name, user_name, level, pyramid):
-        PyramidUserData(
+        pyramid_results.put(PyramidUserData(
             channel_name = channel_name,
             user_name = user_name,
             success = True,
             level = level,
             pyramid = pyramid,
             destroyer_name = None,
-        ).create()
+        ))
 
     @classmethod
     def get_user_stats(cls, channel_name, user_name):
@@ -156,90 +189,110 @@ class PyramidProfiles(Base):
 
         return {x[0].profile_name: x[0] for x in data}
 
+    @classmethod
+    async def aget_all(cls) -> dict[str, 'PyramidProfiles']:
+        return await run_sync(cls.get_all)
+
 class PyramidAcorn(Acorn):
 
     _name = 'pyramid'
-    active = {}
-    last_user = {}
-    last_message = {}
-    level = {}
-    max_level = {}
-    pyramid = {}
     configs: dict[str, PyramidData] = {}
-    profiles = None
-    last_fact = {}
+    profiles: dict[str, 'PyramidProfiles'] = {}
     req_level = 3
+    max_states = 2_000
+    state_idle = 6 * 3_600 # seconds without messages before a channel's state is dropped
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.profiles = PyramidProfiles.get_all()
+        # NOTE: evicted channels come back as a fresh state on their next message
+        self.states: LRUStore[str, PyramidDetector] = LRUStore(self.max_states, self.state_idle, PyramidDetector)
+
+    async def warmup(self, bot: 'Bot') -> None:
+        # NOTE: profiles are global, a change on any shard reloads them everywhere
+        await bot.state.subscribe("pyramid:profiles", self.profiles_changed)
+        self.profiles, configs = await asyncio.gather(PyramidProfiles.aget_all(), PyramidData.apreload(bot.channels))
+        active = self._load_configs(bot, configs)
+        logging.info(f"preloaded {len(configs)} pyramid configs, {active} active")
+
+    async def channels_joined(self, bot: 'Bot', channels: list[str]) -> None:
+        configs = await PyramidData.apreload(channels)
+        active = self._load_configs(bot, configs)
+        logging.info(f"loaded {len(configs)} pyramid configs for joined channels, {active} active")
+
+    async def channels_parted(self, bot: 'Bot', channels: list[str]) -> None:
+        for channel in channels:
+            bot.unsubscribe_nut(channel, self.invoice)
+            self.configs.pop(channel, None)
+
+    def _load_configs(self, bot: 'Bot', configs: dict[str, PyramidData]) -> int:
+        active = 0
+        for channel, config in configs.items():
+            # WHY: a command may have loaded (and changed) the config while we were preloading
+            config = self.configs.setdefault(channel, config)
+            # NOTE: invoice is gated, channels without pyramid watch never actuate it
+            if config.active:
+                bot.subscribe_nut(channel, self.invoice)
+                active += 1
+        return active
+
+    async def profiles_changed(self, payload: dict):
+        self.profiles = await PyramidProfiles.aget_all()
+
+    async def get_config(self, ctx: commands.Context) -> PyramidData:
+        if ctx.channel.name not in self.configs:
+            self.configs[ctx.channel.name] = await PyramidData.aget_data(ctx.channel.name)
+        return self.configs[ctx.channel.name]
+
+    @asynccontextmanager
+    async def edit_config(self, ctx: commands.Context):
+        # WHY: a new channel's default row and the change commit together, before the reply goes out
+        try:
+            async with unit_of_work():
+                yield await self.get_config(ctx)
+        except Exception:
+            self.configs.pop(ctx.channel.name, None) # reloaded from what actually got committed
+            raise
 
     def get_random_fact(self, ctx: commands.Context):
-        rolled = self.last_fact.get(ctx.channel.name)
-        while rolled == self.last_fact.get(ctx.channel.name):
-            rolled = math.floor(random() * len(self.configs[ctx.channel.name].facts))
-        self.last_fact[ctx.channel.name] = rolled
-        return self.configs[ctx.channel.name].facts[rolled]
-
-    def reset_pyramid(self, ctx: commands.Context, user, msg):
-        self.last_user   [ctx.channel.name] = user
-        self.last_message[ctx.channel.name] = msg
-        self.level       [ctx.channel.name] = 0
-        self.max_level   [ctx.channel.name] = 0
-        self.pyramid     [ctx.channel.name] = ''
+        state = self.states.get(ctx.channel.name)
+        facts = self.configs[ctx.channel.name].facts
+        rolled = state.last_fact
+        while rolled == state.last_fact:
+            rolled = math.floor(random() * len(facts))
+        state.last_fact = rolled
+        return facts[rolled]
 
     async def test_pyramid(self, ctx: commands.Context):
         channel = ctx.channel.name
         user    = ctx.author.name
         message = ctx.message.content
-
-        # different chatter
-        if user != self.last_user[channel]:
-            if self.max_level[channel] >= self.req_level:
-                PyramidUserData.save_loss(channel, self.last_user[channel], self.max_level[channel], self.pyramid[channel], user)
-                logging.info(f"#{channel} | {self.last_user[channel]}'s '{self.pyramid[channel]}' pyramid lvl {str(1)}/{str(1)} destroyed by '{user}: {self.last_message[channel]}'")
-            return self.reset_pyramid(ctx, user, message)
-
-        # try to detect pyramid if no ongoing pyramid
-        if self.level[channel] == 0:
-            new_words = count(message)
-            old_words = count(self.last_message[channel])
-            for x, y in new_words.items():
-                # NOTE: DETECTED PYRAMID at lvl 2
-                if y == 2 and x in old_words and old_words[x] == 1:
-                    self.level[channel] = self.max_level[channel] = y
-                    self.pyramid[channel] = x
-                    logging.info(f"#{channel} | '{x}' pyramid lvl {str(1)}/{str(1)} on '{user}: {self.last_message[channel]}'")
-                    logging.info(f"#{channel} | '{x}' pyramid lvl {str(self.level[channel])}/{str(self.max_level[channel])} on '{user}: {message}'")
-                    return
-            return self.reset_pyramid(ctx, user, message)
-
-        occurences = len(message.split(self.pyramid[channel])) - 1
-        dif = occurences - self.level[channel]
-
-        # pyramid goes up by one (and was at highest point)
-        if dif == 1 and self.level[channel] == self.max_level[channel]:
-            self.level[channel] = self.max_level[channel] = occurences
-            logging.info(f"#{channel} | '{self.pyramid[channel]}' pyramid lvl {str(self.level[channel])}/{str(self.max_level[channel])} on '{user}: {message}'")
-            if self.roll(channel, self.configs[channel].profile, self.level[channel], True):
-                return await self.facts_over_feelings(ctx, self.get_random_fact(ctx))
-            return
-
-        # pyramid goes down by one (and achieved required max height)
-        if dif == -1 and self.max_level[channel] >= self.req_level:
-            self.level[channel] = occurences
-            logging.info(f"#{channel} | '{self.pyramid[channel]}' pyramid lvl {str(self.level[channel])}/{str(self.max_level[channel])} on '{user}: {message}'")
-            if self.level[channel] == 1: # at bottom (successful)
-                await self.feelings_won_over(ctx, user, self.max_level[channel], self.pyramid[channel])
-                return self.reset_pyramid(ctx, user, message)
-            else:
-                if self.roll(channel, self.configs[channel].profile, self.level[channel], False):
+        state   = self.states.get(channel)
+
+        match state.feed(user, message, self.req_level):
+            case STEP.RESET:
+                return
+            case STEP.BROKEN:
+                builder, level, pyramid = state.finished
+                PyramidUserData.save_loss(channel, builder, level, pyramid, user)
+                logging.info(f"#{channel} | {builder}'s '{pyramid}' pyramid lvl {str(level)}/{str(level)} destroyed by '{user}: {message}'")
+            case STEP.STARTED:
+                logging.info(f"#{channel} | '{state.pyramid}' pyramid lvl {str(state.level)}/{str(state.max_level)} on '{user}: {message}'")
+            case STEP.UP:
+                logging.info(f"#{channel} | '{state.pyramid}' pyramid lvl {str(state.level)}/{str(state.max_level)} on '{user}: {message}'")
+                if self.roll(channel, self.configs[channel].profile, state.level, True):
                     return await self.facts_over_feelings(ctx, self.get_random_fact(ctx))
-            return
-
-        return self.reset_pyramid(ctx, user, message)
+            case STEP.DOWN:
+                logging.info(f"#{channel} | '{state.pyramid}' pyramid lvl {str(state.level)}/{str(state.max_level)} on '{user}: {message}'")
+                if self.roll(channel, self.configs[channel].profile, state.level, False):
+                    return await self.facts_over_feelings(ctx, self.get_random_fact(ctx))
+            case STEP.COMPLETE:
+                builder, level, pyramid = state.finished
+                logging.info(f"#{channel} | '{pyramid}' pyramid lvl 1/{str(level)} on '{user}: {message}'")
+                await self.feelings_won_over(ctx, builder, level, pyramid)
 
     def roll(self, channel: str, profile: str, level: int, up: bool) -> bool:
+        if profile not in self.profiles:
+            return False # WHY: profiles are still loading
         roll = random()
         bs = self.profiles[profile].up  if up else self.profiles[profile].down
         xs = self.profiles[profile].upx if up else self.profiles[profile].downx
@@ -249,21 +302,19 @@ class PyramidAcorn(Acorn):
 
     async def facts_over_feelings(self, ctx: commands.Context, fact: str):
         result = Result(ECODE.OK, f"/me ▲ FACT: {fact}")
-        await ctx.bot.treat_result(ctx, result)
+        await ctx.bot.treat_result(ctx, result, SEND_PRIORITY.PASSIVE)
 
     async def feelings_won_over(self, ctx: commands.Context, user: str, level: int, pyramid: str):
         logging.info(f"#{ctx.channel.name} | complete '{pyramid}' pyramid lvl {str(level)} by {user}")
         result = Result(ECODE.OK, f"/me ▲ GRATS @{user}: {str(level)} high {pyramid} Clap")
-        await ctx.bot.treat_result(ctx, result)
+        await ctx.bot.treat_result(ctx, result, SEND_PRIORITY.PASSIVE)
         PyramidUserData.save_win(ctx.channel.name, user, level, pyramid)
 
-    @RegexNut()
+    @RegexNut(gated=True)
     async def invoice(self, ctx: commands.Context, match: str = None):
-        if ctx.channel.name not in self.configs:
-            self.reset_pyramid(ctx, '', '')
-            self.configs[ctx.channel.name] = PyramidData.get_data(ctx.channel.name)
+        config = await self.get_config(ctx)
 
-        if self.configs[ctx.channel.name].active:
+        if config.active:
             await self.test_pyramid(ctx)
 
         return Result(ECODE.SILENT, None)
@@ -274,13 +325,9 @@ class PyramidAcorn(Acorn):
         if profile not in self.profiles.keys():
             raise MissingDataException(f"profile '{profile}' does not exist")
 
-        if ctx.channel.name not in self.configs:
-            self.reset_pyramid(ctx, '', '')
-            self.configs[ctx.channel.name] = PyramidData.get_data(ctx.channel.name)
-
-        config = self.configs[ctx.channel.name]
-        config.profile = profile
-        config.save()
+        async with self.edit_config(ctx) as config:
+            config.profile = profile
+            await config.asave()
         logging.info(f"#{ctx.channel.name} | pyramid destroying profile changed to '{profile}' by @{ctx.author.name}")
         return Result(ECODE.OK, f"Dooming profile changed to '{profile}'")
 
@@ -288,15 +335,16 @@ class PyramidAcorn(Acorn):
     @CommandNut(default_aliases=DEFAULT_ALIAS.FULLNAME_ONLY)
     async def createprofile(self, ctx: commands.Context, name: str, up: float, upx: float, down: float, downx: float):
 
-        PyramidProfiles(
+        await PyramidProfiles(
             profile_name = name,
             up           = up,
             upx          = upx,
             down         = down,
             downx        = downx,
-        ).create_or_update()
+        ).acreate_or_update()
 
-        self.profiles = PyramidProfiles.get_all()
+        self.profiles = await PyramidProfiles.aget_all()
+        await ctx.bot.state.publish("pyramid:profiles", {'profile': name})
 
         logging.info(f"#{ctx.channel.name} | pyramid destroying profile '{name}' created by @{ctx.author.name}")
         return Result(ECODE.OK, f"Pyramid dooming profile '{name}' created")
@@ -304,73 +352,64 @@ class PyramidAcorn(Acorn):
     @restrict(PRIVILEDGE.MODERATOR)
     @CommandNut(default_aliases=DEFAULT_ALIAS.FULLNAME_ONLY)
     async def enable(self, ctx: commands.Context):
-        if ctx.channel.name not in self.configs:
-            self.reset_pyramid(ctx, '', '')
-            self.configs[ctx.channel.name] = PyramidData.get_data(ctx.channel.name)
-
-        config = self.configs[ctx.channel.name]
-        config.active = True
-        config.save()
+        async with self.edit_config(ctx) as config:
+            config.active = True
+            await config.asave()
+        ctx.bot.subscribe_nut(ctx.channel.name, self.invoice)
         logging.info(f"#{ctx.channel.name} | pyramid destroying enabled by @{ctx.author.name}")
         return Result(ECODE.OK, f"Pyramid watch enabled")
 
     @restrict(PRIVILEDGE.MODERATOR)
     @CommandNut(default_aliases=DEFAULT_ALIAS.FULLNAME_ONLY)
     async def disable(self, ctx: commands.Context):
-        if ctx.channel.name not in self.configs:
-            self.reset_pyramid(ctx, '', '')
-            self.configs[ctx.channel.name] = PyramidData.get_data(ctx.channel.name)
-
-        config = self.configs[ctx.channel.name]
-        config.active = False
-        config.save()
+        async with self.edit_config(ctx) as config:
+            config.active = False
+            await config.asave()
+        ctx.bot.unsubscribe_nut(ctx.channel.name, self.invoice)
         logging.info(f"#{ctx.channel.name} | pyramid destroying disabled by @{ctx.author.name}")
         return Result(ECODE.OK, f"No longer watching for pyramids")
 
     @restrict(PRIVILEDGE.ADMIN)
     @CommandNut(default_aliases=DEFAULT_ALIAS.FULLNAME_ONLY)
     async def refreshprofiles(self, ctx: commands.Context):
-        self.profiles = PyramidProfiles.get_all()
+        self.profiles = await PyramidProfiles.aget_all()
+        await ctx.bot.state.publish("pyramid:profiles", {})
         logging.info(f"#{ctx.channel.name} | profile values refreshed by @{ctx.author.name}")
         return Result(ECODE.OK, f"Profiles refreshed; available: {list(self.profiles.keys())}")
 
     @restrict(PRIVILEDGE.MODERATOR)
     @CommandNut(default_aliases=DEFAULT_ALIAS.FULLNAME_ONLY)
     async def resetfacts(self, ctx: commands.Context):
-        if ctx.channel.name not in self.configs:
-            self.reset_pyramid(ctx, '', '')
-            self.configs[ctx.channel.name] = PyramidData.get_data(ctx.channel.name)
-
-        config = self.configs[ctx.channel.name]
-        config.facts = default_facts
-        config.save()
+        async with self.edit_config(ctx) as config:
+            config.facts = default_facts
+            await config.asave()
         logging.info(f"#{ctx.channel.name} | pyramid facts reset to default by @{ctx.author.name}")
         return Result(ECODE.OK, f"Pyramid facts reset to default")
 
     @restrict(PRIVILEDGE.MODERATOR)
     @CommandNut(default_aliases=DEFAULT_ALIAS.FULLNAME_ONLY)
     async def addfacts(self, ctx: commands.Context, *args):
-        if ctx.channel.name not in self.configs:
-            self.reset_pyramid(ctx, '', '')
-            self.configs[ctx.channel.name] = PyramidData.get_data(ctx.channel.name)
-
-        config = self.configs[ctx.channel.name]
-        config.facts = list(config.facts) + [str(fact) for fact in args]
-        config.save()
+        async with self.edit_config(ctx) as config:
+            config.facts = list(config.facts) + [str(fact) for fact in args]
+            await config.asave()
         logging.info(f"#{ctx.channel.name} | pyramid facts {str(args)} added successfully by @{ctx.author.name}")
         return Result(ECODE.OK, f"Pyramid facts added successfully")
 
     @restrict(PRIVILEDGE.MODERATOR)
     @CommandNut(default_aliases=DEFAULT_ALIAS.FULLNAME_ONLY)
     async def clearallfacts(self, ctx: commands.Context):
-        if ctx.channel.name not in self.configs:
-            self.reset_pyramid(ctx, '', '')
-            self.configs[ctx.channel.name] = PyramidData.get_data(ctx.channel.name)
-
-        config = self.configs[ctx.channel.name]
-        config.facts = []
-        config.save()
+        async with self.edit_config(ctx) as config:
+            config.facts = []
+            await config.asave()
         logging.info(f"#{ctx.channel.name} | pyramid facts cleared by @{ctx.author.name}")
         return Result(ECODE.OK, f"Pyramid facts list emptied")
 
-
+    @restrict(PRIVILEDGE.ADMIN)
+    @CommandNut(default_aliases=DEFAULT_ALIAS.FULLNAME_ONLY)
+    async def memory(self, ctx: commands.Context, channel: str = None):
+        channel = (channel or ctx.channel.name).lower()
+        sizes = {name: state.memory() for name, state in self.states.items()}
+        total = sum(sizes.values())
+        average = total / len(sizes) if sizes else 0
+        mine = strfbytes(sizes[channel]) if channel in sizes else 'not tracked'
+        return Result(ECODE.OK, f"pyramid state ▲ channels: {len(sizes)}/{self.states.capacity} ▲ total: {strfbytes(total)} ▲ avg: {strfbytes(average)} ▲ evicted: {self.states.evictions} ▲ #{channel}: {mine}")
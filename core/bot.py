@@ -1,7 +1,9 @@
 import datetime as dt
 from typing import List, Tuple, Union, Collection
 from asyncio import as_completed
+import asyncio
 import traceback
+from time import perf_counter_ns
 
 from twitchio.ext.commands import Context
 from twitchio.message import Message
@@ -16,10 +18,25 @@ from core.patches.websocket import apply_websocket_patch
 from core.patches.context import new_context
 from core.database.auths import BotAuths
 from core.database.settings import Channels
+from core.database.writer import BufferedWriter
 from core.utils.logger import get_log
 from core.nut.nut import CommandNut, RegexNut
+from core.nut.dispatch import RegexDispatcher
+from core.nut.cooldowns import get_cooldowns, use_cooldowns, LocalCooldowns, SharedCooldowns
+from core.nut.restrictions import set_ambassadors
 from core.nut.result import Result, ECODE
-from core.config import ENVIRONMENT, GITHASH, GITSUMMARY , GITWHEN
+from core.pipeline.channels import ChannelDispatcher
+from core.pipeline.admission import AdmissionController, PRIORITY
+from core.pipeline.outbound import OutboundScheduler, SEND_PRIORITY
+from core.pipeline.tracing import Tracer, Trace, current_trace
+from core.pipeline.delivery import DeliveryTracker
+from core.pipeline.joins import JoinScheduler, JOIN_PRIORITY
+from core.pipeline.sharding import COORDINATOR_TOPIC, shard_topic, share_limits
+from core.utils.watchdog import LoopWatchdog
+from core.utils.startup import timeline
+from core.utils.sharedstate import connect_state
+from core.database.sql import executor, unit_of_work
+from core.config import ENVIRONMENT, DISPATCH, OUTBOUND, TRACING, WATCHDOG, JOINS, SHARDS, COOLDOWNS, git_info
 from core.utils.format import beauty, one_line_exception
 
 logging = get_log(__name__)
@@ -30,65 +47,247 @@ class Bot(Client):
     channels: list[str]
     _acorns: dict[str, Acorn] = {}
     _command_nuts: dict[str, CommandNut] = {}
-    _regex_nuts: list[RegexNut] = []
+    _regex_nuts: RegexDispatcher = RegexDispatcher()
     _command_prefix = "🏜️"
     _dev_prefix = "_"
 
-    def __init__(self, user_id: str):
+    def __init__(self, user_id: str, shard: str = None):
         # Initialise our Bot with our access token, prefix and a list of channels to join on boot...
         # prefix can be a callable, which returns a list of strings or a string...
         # initial_channels can also be a callable which returns a list of strings...
 
-        auths = BotAuths.get(user_id)
-        self.channels = Channels.get_active_channels()
+        # NOTE: a shard only carries the channels the coordinator assigns it after hello, see core.pipeline.sharding
+        self.shard = shard
+        self.state = connect_state(SHARDS.get('state', 'memory://') if shard is not None else 'memory://', SHARDS.get('prefix', "dtpbot:"))
+        self._assigned = asyncio.Event()
+
+        with timeline.phase("db warmup"):
+            # NOTE: both queries at once, which also opens two pooled connections early
+            auths    = executor.submit(BotAuths.get, user_id)
+            channels = executor.submit(Channels.get_active_channels) if shard is None else None
+            auths, self.channels = auths.result(), channels.result() if channels is not None else []
+
+        if shard is not None:
+            # profiles and cooldowns are global, every shard checks the same keys
+            use_cooldowns(SharedCooldowns(self.state.keys, COOLDOWNS.get('prefix', "dtpbot:cooldown:"), LocalCooldowns(COOLDOWNS.get('capacity', 50_000))))
         logging.info("Initial channels: %s", str(self.channels))
+        # WHY: no initial_channels, twitchio would join them all at once and only rejoin those after a reconnect
         super().__init__(
             token            = auths.token,
             client_secret    = auths.client_secret,
-            initial_channels = self.channels
         )
         apply_http_patch(self, auths)
+        self.delivery = DeliveryTracker(OUTBOUND.get('ack_timeout', 10))
         apply_websocket_patch(self)
 
+        self.dispatcher = ChannelDispatcher(
+            self.process_traced,
+            workers   = DISPATCH.get('workers', 8),
+            max_depth = DISPATCH.get('max_depth', 200),
+        )
+        self.admission = AdmissionController(
+            channel_soft = DISPATCH.get('channel_soft', 50),
+            channel_hard = DISPATCH.get('channel_hard', 150),
+            global_soft  = DISPATCH.get('global_soft', 500),
+            global_hard  = DISPATCH.get('global_hard', 2_000),
+            sample_every = DISPATCH.get('sample_every', 10),
+        )
+        shards = SHARDS.get('count', 1) if shard is not None else 1
+        self.outbound = OutboundScheduler(share_limits(OUTBOUND, {'global_regular': 20, 'global_elevated': 100}, shards))
+        self.tracer = Tracer(TRACING)
+        self.watchdog = LoopWatchdog(WATCHDOG.get('interval', 0.1), WATCHDOG.get('threshold', 0.5))
+        self.joins = JoinScheduler(self._connection.send, share_limits(JOINS, {'rate': 20}, shards))
+        self._booted = False
+        self._background_tasks: set[asyncio.Task] = set()
+
     def run(self):
         self.start_time = dt.datetime.now()
         super().run()
 
+    async def close(self):
+        await self.joins.stop()
+        await self.watchdog.stop()
+        await self.dispatcher.stop()
+        await self.outbound.stop()
+        await asyncio.gather(*[acorn.shutdown(self) for acorn in self._acorns.values()], return_exceptions=True)
+        await BufferedWriter.drain_all()
+        await get_cooldowns().close()
+        await self.state.close()
+        await super().close()
+
     async def event_ready(self):
         logging.info('Logged in as | %s', self.nick)
         logging.info('User id is | %s', self.user_id)
 
-        await self.join_channels([self.nick])
-
-        self.add_acorn(MetaAcorn(self))
-        self.add_acorn(PyramidAcorn())
-        self.add_acorn(TwitchAcorn())
+        # NOTE: fired again on every reconnect, the new connection has to rejoin everything
+        if self._booted:
+            logging.info(f"reconnected, rejoining {len(self.joins.wanted)} channels")
+            self.joins.reconnected()
+            self._background(self.prioritise_live(list(self.joins.wanted)))
+            return
+        self._booted = True
+
+        timeline.mark("connected")
+        self.watchdog.start()
+
+        with timeline.phase("acorns"):
+            self.add_acorn(MetaAcorn(self))
+            self.add_acorn(PyramidAcorn())
+            self.add_acorn(TwitchAcorn())
+
+        async def preloads():
+            with timeline.phase("preloads"):
+                ambassadors, *_ = await asyncio.gather(
+                    Channels.aget_ambassadors(),
+                    asyncio.to_thread(git_info),
+                    *[acorn.warmup(self) for acorn in self._acorns.values()],
+                )
+                set_ambassadors(ambassadors)
+
+        async def joins():
+            with timeline.phase("joins"):
+                if self.shard is not None:
+                    await self.state.subscribe(shard_topic(self.shard), self.on_shard_message)
+                    await self.state.publish(COORDINATOR_TOPIC, {'op': 'hello', 'shard': self.shard})
+                    # WHY: the coordinator parts the channels we get back from the shards that held them first
+                    try:
+                        async with asyncio.timeout(SHARDS.get('assign_timeout', 30)):
+                            await self._assigned.wait()
+                    except TimeoutError:
+                        logging.warning(f"{self.shard} got no channels from the coordinator yet, carrying none until it answers")
+                if self.nick not in self.channels:
+                    await self.join_channels([self.nick]) # NOTE: a shard only asks, the coordinator knows the owner
+                self.joins.want([channel for channel in self.channels if channel != self.nick])
+                self._background(self.prioritise_live(self.channels))
+                if self.nick in self.channels:
+                    self.joins.want([self.nick], JOIN_PRIORITY.OWN)
+                    await self.joins.wait_joined(self.nick, JOINS.get('timeout', 15))
+
+        await asyncio.gather(preloads(), joins())
+
+        git = git_info()
+        if self.nick in self.channels:
+            ctx = new_context(self)
+            await self.sendprivmsg(ctx, f"I am alive! build {git['GITHASH']} as of {git['GITWHEN']} \"{git['GITSUMMARY']}\"")
+        timeline.mark("ready")
+
+    def _background(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def prioritise_live(self, channels: list[str]):
+        # live channels are where people are waiting on us, they get joined first
+        live = []
+        for i in range(0, len(channels), 100): # helix limit per request
+            try:
+                streams = await self.fetch_streams(user_logins=channels[i:i + 100])
+            except Exception as e:
+                logging.warning(f"could not fetch live channels, joining in default order: {e!r}")
+                return
+            chunk = [stream.user.name.lower() for stream in streams]
+            self.joins.prioritise(chunk, JOIN_PRIORITY.LIVE)
+            live.extend(chunk)
+        logging.info(f"{len(live)} live channels joined first")
 
-        ctx = new_context(self)
-        await self.sendprivmsg(ctx, f"I am alive! build {GITHASH} as of {GITWHEN} \"{GITSUMMARY}\"")
+    async def event_join(self, channel, user):
+        if user.name == self.nick:
+            self.joins.confirm(channel.name)
 
     async def join_channels(self, channels: Union[List[str], Tuple[str]]):
-        joined = []
-        for channel in channels:
-            if channel not in self.channels:
-                self.channels.append(channel)
-                Channels.add(channel)
-                joined.append(channel)
+        if self.shard is not None:
+            # WHY: the coordinator picks the shard, it may not be this one
+            await self.state.publish(COORDINATOR_TOPIC, {'op': 'join', 'channels': list(channels)})
+            return
+        joined = [channel for channel in dict.fromkeys(channels) if channel not in self.channels]
         if len(joined) > 0:
-            logging.info("joining channels: %s", str(joined))
-            await super().join_channels(joined)
+            await Channels.aupsert_active(joined)
+            self.assign_channels(joined)
 
     async def part_channels(self, channels: Union[List[str], Tuple[str]]):
-        parted = []
-        for channel in channels:
-            if channel in self.channels:
-                Channels.part(channel)
-                parted.append(channel)
+        if self.shard is not None:
+            await self.state.publish(COORDINATOR_TOPIC, {'op': 'part', 'channels': list(channels)})
+            return
+        parted = [channel for channel in dict.fromkeys(channels) if channel in self.channels]
+        async with unit_of_work():
+            for channel in parted:
+                await Channels.apart(channel)
+        await self.unassign_channels(parted)
+
+    def assign_channels(self, channels: list[str]):
+        joined = [channel for channel in channels if channel not in self.channels]
+        if len(joined) > 0:
+            logging.info("joining channels: %s", str(joined))
+            self.channels.extend(joined)
+            self.joins.want(joined, JOIN_PRIORITY.REQUESTED)
+            if self.nick in joined:
+                self.joins.want([self.nick], JOIN_PRIORITY.OWN)
+            self._background(self._acorn_hook('channels_joined', joined))
+
+    async def unassign_channels(self, channels: list[str]):
+        parted = [channel for channel in channels if channel in self.channels]
+        for channel in parted:
+            self.channels.remove(channel)
+            self.joins.forget(channel)
         if len(parted) > 0:
             logging.info("parting channels: %s", str(parted))
-            await super().part_channels(channels)
+            self._background(self._acorn_hook('channels_parted', parted))
+            await super().part_channels(parted)
+
+    async def _acorn_hook(self, hook: str, channels: list[str]):
+        results = await asyncio.gather(*[getattr(acorn, hook)(self, channels) for acorn in self._acorns.values()], return_exceptions=True)
+        for acorn, result in zip(self._acorns.values(), results):
+            if isinstance(result, Exception):
+                logging.error(f"<{acorn.name}> {hook} failed for {channels}: {one_line_exception(result)}")
+
+    async def on_shard_message(self, payload: dict):
+        match payload['op']:
+            case 'join':
+                self.assign_channels(payload['channels'])
+            case 'part':
+                await self.unassign_channels(payload['channels'])
+            case 'assign': # everything this shard owns, the answer to hello
+                self.assign_channels(payload['channels'])
+                self._assigned.set()
+
+    def classify(self, message: Message) -> PRIORITY:
+        content = message.content
+        if ENVIRONMENT == 'dev' and content.startswith(self._dev_prefix):
+            content = content[len(self._dev_prefix):].strip()
+        if content.startswith(self._command_prefix):
+            return PRIORITY.COMMAND
+        author = message.author
+        # NOTE: own messages count as moderator ones, pyramid breaks are verified through them
+        if message.echo or getattr(author, 'is_mod', False) or getattr(author, 'is_broadcaster', False):
+            return PRIORITY.MODERATOR
+        return PRIORITY.PASSIVE
 
     async def event_message(self, message: Message):
+        # WHY: twitchio runs every message as its own task; queue them so each channel is handled in order
+        self.dispatcher.start()
+
+        channel  = message.channel.name
+        priority = self.classify(message)
+        if not self.admission.admit(channel, priority, self.dispatcher.depth(channel), self.dispatcher.total_depth):
+            return
+
+        if not self.dispatcher.submit(channel, self.tracer.begin(message), urgent=priority < PRIORITY.PASSIVE):
+            logging.debug(f"#{channel} | queue full, message dropped")
+
+    async def process_traced(self, trace: Trace):
+        start = perf_counter_ns()
+        trace.record("queue", start - trace.received)
+        # NOTE: replies queued while processing pick the trace up from the context
+        token = current_trace.set(trace)
+        try:
+            await self.process_message(trace.message)
+        finally:
+            current_trace.reset(token)
+            trace.record("nuts", perf_counter_ns() - start)
+            trace.processed = True
+            trace.settle()
+
+    async def process_message(self, message: Message):
         # removes echo check
         ctx = Context(message, self)
 
@@ -115,9 +314,9 @@ class Bot(Client):
             if kword in self._command_nuts:
                 nutting_list.append(self._command_nuts[kword].actuate(ctx))
 
-        # regex nuts
-        for nut in self._regex_nuts:
-            nutting_list.append(nut.actuate(ctx))
+        # regex nuts (only the ones that matched)
+        for nut, match in self._regex_nuts.matches(ctx.channel.name, ctx.message.content):
+            nutting_list.append(nut.actuate(ctx, match=match))
 
         for nut in as_completed(nutting_list):
             result = await nut
@@ -136,10 +335,16 @@ class Bot(Client):
         logging.info('acorn <%s> unloaded', acorn_name)
 
     def add_regex_nut(self, nut: RegexNut):
-        self._regex_nuts.append(nut)
+        self._regex_nuts.add(nut)
 
     def remove_regex_nut(self, nut: RegexNut):
-        self._regex_nuts.pop(nut)
+        self._regex_nuts.remove(nut)
+
+    def subscribe_nut(self, channel: str, nut: RegexNut):
+        self._regex_nuts.subscribe(channel, nut)
+
+    def unsubscribe_nut(self, channel: str, nut: RegexNut):
+        self._regex_nuts.unsubscribe(channel, nut)
 
     def add_command_nut(self, nut: CommandNut, aliases: list[str] = None):
         """Method which registers a command for use by the bot.
@@ -171,24 +376,32 @@ class Bot(Client):
                     continue
                 del self._command_nuts[alias]
 
-    async def treat_result(self, ctx: Context, result: Result):
+    async def event_userstate(self, user):
+        # USERSTATE tells us whether we are mod/VIP here, which decides our PRIVMSG limits
+        elevated = user.is_mod or user.is_vip or user.is_broadcaster
+        if elevated != self.outbound.is_elevated(user.channel.name):
+            logging.info(f"#{user.channel.name} | elevated chat limits: {elevated}")
+            self.outbound.set_elevated(user.channel.name, elevated)
+
+    async def treat_result(self, ctx: Context, result: Result, priority: SEND_PRIORITY = SEND_PRIORITY.REPLY):
         if isinstance(result, Result):
             match result.code:
                 case ECODE.OK:
-                    await self.sendprivmsg(ctx, result.result)
+                    await self.sendprivmsg(ctx, result.result, priority)
                 case ECODE.SILENT:
                     pass
                 case ECODE.ERROR:
                     logging.warning(f"#{ctx.channel.name} @{ctx.author.name}: {ctx.original_content} ▲ {result.code} {result.code.name} ▲ {one_line_exception(result.result)}")
-                    await self.sendprivmsg(ctx, str(result.result))
+                    await self.sendprivmsg(ctx, str(result.result), priority)
                 case _:
                     logging.error(f"#{ctx.channel.name} @{ctx.author.name}: {ctx.original_content} ▲ {result.code} {result.code.name} ▲ {traceback.format_exception(result.result)}")
         else:
             logging.error(f"#{ctx.channel.name} @{ctx.author.name}: {ctx.original_content} ▲ no Result object ▲ {result}")
 
-    async def sendprivmsg(self, ctx: Context, message: str | Collection[str]):
+    async def sendprivmsg(self, ctx: Context, message: str | Collection[str], priority: SEND_PRIORITY = SEND_PRIORITY.REPLY):
+        # NOTE: only queues, the outbound scheduler sends once the rate limits allow it
         if isinstance(message, str):
-            await ctx.send(beauty(message))
+            self.outbound.enqueue(ctx, beauty(message), priority)
         else:
             for msg in message:
-                await ctx.send(beauty(msg))
\ No newline at end of file
+                self.outbound.enqueue(ctx, beauty(msg), priority)
\ No newline at end of file
@@ -1,19 +1,44 @@
 import yaml
 import datetime as dt
 
-from git import Repo
-
 with open('./environment.yaml', 'r', encoding='utf-8') as f:
     yaml_data = yaml.safe_load(f)
 
 CLIENT_ID = yaml_data['CLIENT_ID']
 SQLALCHEMY = yaml_data['SQLALCHEMY']
+SQLALCHEMY_WORKERS = yaml_data.get('SQLALCHEMY_WORKERS', 4)
+SQLALCHEMY_POOL = yaml_data.get('SQLALCHEMY_POOL', {})
 
 GODS = yaml_data['GODS']
 BOTNAME = yaml_data['BOTNAME']
 ENVIRONMENT = yaml_data['ENVIRONMENT']
 
-GITCOMMIT = Repo('./').commit()
-GITHASH = GITCOMMIT.hexsha[:7]
-GITWHEN = dt.datetime.fromtimestamp(GITCOMMIT.committed_datetime.timestamp(), tz=dt.timezone.utc).isoformat().replace("+00:00", "Z")
-GITSUMMARY = GITCOMMIT.summary
\ No newline at end of file
+DISPATCH = yaml_data.get('DISPATCH', {})
+OUTBOUND = yaml_data.get('OUTBOUND', {})
+COOLDOWNS = yaml_data.get('COOLDOWNS', {})
+METRICS = yaml_data.get('METRICS', {})
+TRACING = yaml_data.get('TRACING', {})
+WATCHDOG = yaml_data.get('WATCHDOG', {})
+JOINS = yaml_data.get('JOINS', {})
+SHARDS = yaml_data.get('SHARDS', {})
+
+_git: dict = None
+
+def git_info() -> dict:
+    # NOTE: GitPython is only imported (and the repo opened) the first time this is needed
+    global _git
+    if _git is None:
+        from git import Repo
+        commit = Repo('./').commit()
+        _git = {
+            'GITCOMMIT' : commit,
+            'GITHASH'   : commit.hexsha[:7],
+            'GITWHEN'   : dt.datetime.fromtimestamp(commit.committed_datetime.timestamp(), tz=dt.timezone.utc).isoformat().replace("+00:00", "Z"),
+            'GITSUMMARY': commit.summary,
+        }
+    return _git
+
+def __getattr__(name: str):
+    if name in ('GITCOMMIT', 'GITHASH', 'GITWHEN', 'GITSUMMARY'):
+        return git_info()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
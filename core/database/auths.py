@@ -1,7 +1,7 @@
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
 
-from core.database.sql import Base, create_session
+from core.database.sql import Base, create_session, run_sync
 
 class AuthMissing(Exception): ...
 
@@ -22,7 +22,6 @@ class BotAuths(Base):
                 raise AuthMissing()
             return res
 
-    def save(self):
-        with create_session() as session:
-            session.add(self)
-            session.commit()
+    @classmethod
+    async def aget(cls, user_id: str) -> 'BotAuths':
+        return await run_sync(cls.get, user_id)
@@ -4,7 +4,7 @@ from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy import String, Column, select
 
 from core.utils.logger import get_log
-from core.database.sql import Base, create_session
+from core.database.sql import Base, create_session, run_sync
 
 logging = get_log(__name__)
 
@@ -36,6 +36,23 @@ class Channels(Base):
         ).delete()
         return user_name
 
+    @classmethod
+    def upsert_active(cls, user_names: list[str]) -> list[str]:
+        # one statement for the whole batch, existing rows are just marked active again
+        cls.bulk_create_or_update([{'user_name': user_name, 'active': True} for user_name in user_names], update=['active'])
+        return user_names
+
+    @classmethod
+    async def aupsert_active(cls, user_names: list[str]) -> list[str]:
+        return await run_sync(cls.upsert_active, user_names)
+
+    @classmethod
+    async def aadd(cls, user_name) -> str:
+        return await run_sync(cls.add, user_name)
+
+    @classmethod
+    async def apart(cls, user_name) -> str:
+        return await run_sync(cls.part, user_name)
 
     @classmethod
     def get_active_channels(cls) -> str:
@@ -43,3 +60,18 @@ class Channels(Base):
             stmt = select(Channels)
             result = session.execute(stmt)
             return [channel[0].user_name for channel in result.all()]
+
+    @classmethod
+    async def aget_active_channels(cls) -> str:
+        return await run_sync(cls.get_active_channels)
+
+
+    @classmethod
+    def get_ambassadors(cls) -> dict[str, list[str]]:
+        with create_session() as session:
+            stmt = select(Channels.user_name, Channels.ambassators).where(Channels.ambassators.is_not(None))
+            return {user_name: ambassators for user_name, ambassators in session.execute(stmt).all()}
+
+    @classmethod
+    async def aget_ambassadors(cls) -> dict[str, list[str]]:
+        return await run_sync(cls.get_ambassadors)
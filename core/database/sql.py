@@ -1,15 +1,172 @@
-from typing import Iterable
+from typing import Iterable, Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar, copy_context
+from functools import partial
+from time import perf_counter
+import asyncio
+import io
 
 from sqlalchemy.orm import DeclarativeBase, Session
-from sqlalchemy import create_engine, update, delete, and_
+from sqlalchemy import create_engine, update, delete, and_, inspect, Connection
 from sqlalchemy.dialects.postgresql import insert
 
-from core.config import SQLALCHEMY
+from core.config import SQLALCHEMY, SQLALCHEMY_WORKERS, SQLALCHEMY_POOL
+from core.utils.logger import get_log
 
-engine = create_engine(SQLALCHEMY)
+logging = get_log(__name__)
 
-def create_session():
-    return Session(engine)
+# NOTE: connections past pool_size are closed when returned, keep it above what is used at once:
+# one per executor thread plus one per open unit of work
+engine = create_engine(
+    SQLALCHEMY,
+    pool_size     = SQLALCHEMY_POOL.get('size', SQLALCHEMY_WORKERS + 2),
+    max_overflow  = SQLALCHEMY_POOL.get('overflow', 10),
+    pool_timeout  = SQLALCHEMY_POOL.get('timeout', 30),
+    pool_recycle  = SQLALCHEMY_POOL.get('recycle', 1_800),
+    pool_pre_ping = SQLALCHEMY_POOL.get('pre_ping', True),
+)
+
+# WHY: psycopg2 blocks, so coroutines hand their queries to a small bounded pool instead of freezing the loop
+executor = ThreadPoolExecutor(max_workers=SQLALCHEMY_WORKERS, thread_name_prefix="db")
+
+class UnitOfWork():
+    """One connection and one transaction for a group of writes that belong together.
+
+    Sessions created inside the scope work in a savepoint of its transaction:
+    their ``commit()`` releases it and a failed flush only rolls back its own.
+    The connection is checked out on first use and held until the scope ends,
+    so keep the scope around the db calls and commit before replying or
+    publishing anything that depends on the writes.
+    """
+
+    committed   = 0
+    rolled_back = 0
+
+    def __init__(self):
+        self.connection: Connection = None
+        self.open = True
+        # WHY: coroutines may share the scope, but a connection is used by one thread at a time
+        self.lock = asyncio.Lock()
+
+    def connect(self) -> Connection:
+        if self.connection is None:
+            self.connection = engine.connect()
+            self.connection.begin() # WHY: sessions only leave the commit to us if a transaction is already open
+        return self.connection
+
+    def finish(self, commit: bool):
+        self.open = False
+        if self.connection is None:
+            return
+        try:
+            if commit:
+                self.connection.commit()
+                UnitOfWork.committed += 1
+            else:
+                self.connection.rollback()
+                UnitOfWork.rolled_back += 1
+        finally:
+            self.connection.close()
+
+current_uow: ContextVar[UnitOfWork] = ContextVar('current_uow', default=None)
+
+@asynccontextmanager
+async def unit_of_work():
+    if current_uow.get() is not None:
+        yield current_uow.get() # nested scopes join the outer one
+        return
+    uow = UnitOfWork()
+    token = current_uow.set(uow)
+    # NOTE: finished off the db executor, its threads may all be waiting on the pool for this connection
+    try:
+        yield uow
+    except BaseException:
+        current_uow.reset(token)
+        try:
+            await asyncio.to_thread(uow.finish, False)
+        except Exception:
+            logging.exception("unit of work failed to roll back")
+        raise
+    current_uow.reset(token)
+    await asyncio.to_thread(uow.finish, True) # WHY: a failed commit raises, nothing may report success before it
+
+def create_session(**kwargs):
+    uow = current_uow.get()
+    if uow is not None and uow.open:
+        return Session(uow.connect(), join_transaction_mode="create_savepoint", **kwargs)
+    return Session(engine, **kwargs)
+
+async def run_sync(fun: Callable, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # WHY: run_in_executor drops the context, the unit of work has to follow the call to the thread
+    call = partial(copy_context().run, fun, *args, **kwargs)
+    uow = current_uow.get()
+    if uow is None or not uow.open:
+        return await loop.run_in_executor(executor, call)
+    async with uow.lock:
+        return await loop.run_in_executor(executor, call)
+
+@contextmanager
+def _connection():
+    uow = current_uow.get()
+    if uow is not None and uow.open:
+        yield uow.connect()
+        return
+    # WHY: raw cursor work never autobegins, only an explicit transaction commits it (or rolls it back on error)
+    with engine.begin() as connection:
+        yield connection
+
+@contextmanager
+def _session_scope(session: Session = None):
+    # NOTE: a session handed in by the caller is the caller's to commit
+    if session is not None:
+        yield session
+        return
+    with create_session(expire_on_commit=False) as session:
+        yield session
+        session.commit()
+
+def chunked(rows: list, size: int) -> Iterable[list]:
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+def _group(objs: 'Iterable[Base | dict]') -> dict[tuple[str, ...], list[dict]]:
+    # WHY: one multi-row statement needs the same columns in every row
+    groups = {}
+    for obj in objs:
+        row = obj if isinstance(obj, dict) else obj.to_dict()
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    return groups
+
+_copy_escapes = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+def _copy_value(value) -> str:
+    # COPY text format
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (list, tuple, dict)):
+        raise ValueError("COPY only takes scalar columns, use bulk_create_or_update")
+    return str(value).translate(_copy_escapes)
+
+class BulkStats():
+
+    __slots__ = ("table", "rows", "seconds", "returned")
+
+    def __init__(self, table: str, rows: int, seconds: float, returned: list = None):
+        self.table    = table
+        self.rows     = rows
+        self.seconds  = seconds
+        self.returned = returned
+
+    @property
+    def rate(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0
+
+    def __repr__(self) -> str:
+        return f"{self.table} | {self.rows} rows in {self.seconds * 1000:.0f}ms ({self.rate:.0f} rows/s)"
 
 class Base(DeclarativeBase):
 
@@ -17,22 +174,31 @@ class Base(DeclarativeBase):
         return {x: y for x, y in self.__dict__.items() if x[0] != '_'}
 
     def save(self):
-        with create_session() as session:
-            stmt = update(self.__class__)
-            session.execute(stmt, [self.to_dict()])
+        if inspect(self).key is None: # never loaded, nothing knows what changed
+            with create_session() as session:
+                session.execute(update(self.__class__), [self.to_dict()])
+                session.commit()
+            return
+        # NOTE: only the changed columns go out, WHERE on the primary key
+        with create_session(expire_on_commit=False) as session:
+            session.add(self)
             session.commit()
 
     def create(self):
-        with create_session() as session:
+        with create_session(expire_on_commit=False) as session:
             session.add(self)
             session.commit()
 
-    def create_or_update(self):
+    @classmethod
+    def bulk_create(cls, objs: 'Iterable[Base]') -> BulkStats:
+        start = perf_counter()
         with create_session() as session:
-            data = self.to_dict()
-            stmt = insert(self.__class__).values(data).on_conflict_do_update(constraint=self.__table__.primary_key, set_=data)
-            session.execute(stmt)
+            session.add_all(objs)
             session.commit()
+        return BulkStats(cls.__tablename__, len(objs), perf_counter() - start)
+
+    def create_or_update(self):
+        self.bulk_create_or_update([self])
 
     def delete(self):
         with create_session() as session:
@@ -46,17 +212,89 @@ class Base(DeclarativeBase):
             session.execute(stmt)
             session.commit()
 
+    async def asave(self):
+        return await run_sync(self.save)
+
+    async def acreate(self):
+        return await run_sync(self.create)
+
+    async def acreate_or_update(self):
+        return await run_sync(self.create_or_update)
+
+    async def adelete(self):
+        return await run_sync(self.delete)
+
     @classmethod
-    def bulk_update(cls, objs: 'Iterable[Base]'):
-        with create_session() as session:
-            stmt = update(objs[0].__class__).values([o.to_dict() for o in objs])
-            session.execute(stmt)
-            session.commit()
+    def bulk_update(cls, objs: 'Iterable[Base | dict]', chunk_size: int = 500, session: Session = None) -> BulkStats:
+        """Executemany ``UPDATE ... WHERE <primary key>``, every row has to carry its primary key."""
+        start = perf_counter()
+        rows = 0
+        with _session_scope(session) as session:
+            for group in _group(objs).values():
+                for chunk in chunked(group, chunk_size):
+                    session.execute(update(cls), chunk)
+                    rows += len(chunk)
+        stats = BulkStats(cls.__tablename__, rows, perf_counter() - start)
+        logging.debug(f"updated {stats}")
+        return stats
 
     @classmethod
-    def bulk_create_or_update(cls, objs: 'Iterable[Base]'):
-        with create_session() as session:
-            data = [o.to_dict() for o in objs]
-            stmt = insert(objs[0].__class__).values(data).on_conflict_do_update(constraint=cls.__table__.primary_key, set_=data)
-            session.execute(stmt)
-            session.commit()
+    async def abulk_update(cls, objs: 'Iterable[Base | dict]', chunk_size: int = 500) -> BulkStats:
+        return await run_sync(cls.bulk_update, objs, chunk_size)
+
+    @classmethod
+    def bulk_create_or_update(cls, objs: 'Iterable[Base | dict]', update: Iterable[str] = None, chunk_size: int = 500,
+                              returning: bool = False, session: Session = None) -> BulkStats:
+        """Multi-row ``INSERT ... ON CONFLICT (<primary key>) DO UPDATE``, ``chunk_size`` rows per statement.
+
+        Conflicting rows take the ``update`` columns from the new row (every given non key
+        column by default, none at all is ``DO NOTHING``). With ``returning`` the written
+        objects end up in ``stats.returned``.
+        """
+        start = perf_counter()
+        keys = [column.name for column in cls.__table__.primary_key]
+        rows = 0
+        returned = [] if returning else None
+        with _session_scope(session) as session:
+            for columns, group in _group(objs).items():
+                stmt = insert(cls)
+                set_ = [column for column in (columns if update is None else update) if column not in keys]
+                if set_:
+                    stmt = stmt.on_conflict_do_update(index_elements=keys, set_={column: stmt.excluded[column] for column in set_})
+                else:
+                    stmt = stmt.on_conflict_do_nothing(index_elements=keys)
+                for chunk in chunked(group, chunk_size):
+                    if returning:
+                        returned.extend(session.scalars(stmt.values(chunk).returning(cls)))
+                    else:
+                        session.execute(stmt.values(chunk))
+                    rows += len(chunk)
+        stats = BulkStats(cls.__tablename__, rows, perf_counter() - start, returned)
+        logging.debug(f"upserted {stats}")
+        return stats
+
+    @classmethod
+    async def abulk_create_or_update(cls, objs: 'Iterable[Base | dict]', update: Iterable[str] = None, chunk_size: int = 500,
+                                     returning: bool = False) -> BulkStats:
+        return await run_sync(cls.bulk_create_or_update, objs, update, chunk_size, returning)
+
+    @classmethod
+    def bulk_copy(cls, objs: 'Iterable[Base | dict]', chunk_size: int = 5_000) -> BulkStats:
+        """``COPY ... FROM STDIN`` for append-only tables, no conflict handling, no ORM events, scalar columns only."""
+        start = perf_counter()
+        rows = 0
+        with _connection() as connection:
+            cursor = connection.connection.cursor()
+            for columns, group in _group(objs).items():
+                sql = f"COPY {cls.__table__.fullname} ({', '.join(columns)}) FROM STDIN"
+                for chunk in chunked(group, chunk_size):
+                    data = ''.join('\t'.join(_copy_value(row[column]) for column in columns) + '\n' for row in chunk)
+                    cursor.copy_expert(sql, io.StringIO(data))
+                    rows += len(chunk)
+        stats = BulkStats(cls.__tablename__, rows, perf_counter() - start)
+        logging.debug(f"copied {stats}")
+        return stats
+
+    @classmethod
+    async def abulk_copy(cls, objs: 'Iterable[Base | dict]', chunk_size: int = 5_000) -> BulkStats:
+        return await run_sync(cls.bulk_copy, objs, chunk_size)
@@ -0,0 +1,103 @@
+from collections import deque
+import asyncio
+import time
+
+from core.database.sql import Base, run_sync, current_uow
+from core.utils.logger import get_log
+
+logging = get_log(__name__)
+
+class BufferedWriter():
+    """Write-behind buffer for append-only rows.
+
+    Rows are inserted in bulk once ``max_batch`` rows are pending or
+    ``max_delay`` seconds went by, whichever comes first. ``copy`` writes them
+    with COPY instead of INSERT, for tables nothing else writes to.
+    """
+
+    writers: dict[str, 'BufferedWriter'] = {}
+
+    def __init__(self, name: str, max_batch: int = 200, max_delay: float = 5.0, max_depth: int = 10_000, copy: bool = False):
+        self.name      = name
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_depth = max_depth
+        self.copy      = copy
+
+        self._buffer: deque[Base] = deque(maxlen=max_depth) # NOTE: full, the oldest row makes room
+        self._wakeup = asyncio.Event()
+        self._lock   = asyncio.Lock()
+        self._task: asyncio.Task = None
+
+        self.flushed = 0
+        self.dropped = 0
+        self.failed  = 0
+        self.flush_latency = deque(maxlen=120) # seconds, latest flushes
+        self.rows_per_second = 0.0 # of the latest flush
+
+        self.writers[name] = self
+
+    @property
+    def depth(self) -> int:
+        return len(self._buffer)
+
+    def put(self, row: Base):
+        if len(self._buffer) >= self.max_depth:
+            self.dropped += 1
+        self._buffer.append(row)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        if len(self._buffer) >= self.max_batch:
+            self._wakeup.set()
+
+    async def _run(self):
+        # WHY: a task started inside a unit of work inherits it; flushes commit on their own
+        current_uow.set(None)
+        while True:
+            try:
+                async with asyncio.timeout(self.max_delay):
+                    await self._wakeup.wait()
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            while self._buffer:
+                batch = [self._buffer.popleft() for _ in range(min(self.max_batch, len(self._buffer)))]
+                start = time.perf_counter()
+                model = type(batch[0])
+                try:
+                    stats = await run_sync(model.bulk_copy if self.copy else model.bulk_create, batch)
+                except Exception:
+                    self.failed += 1
+                    logging.exception(f"writer <{self.name}> failed to flush {len(batch)} rows, retrying on the next flush")
+                    self._requeue(batch)
+                    return
+                self.flush_latency.append(time.perf_counter() - start)
+                self.flushed += len(batch)
+                self.rows_per_second = stats.rate
+
+    def _requeue(self, batch: list[Base]):
+        # back in front of the newer rows, the oldest ones go if that overflows the buffer
+        room = self.max_depth - len(self._buffer)
+        if room < len(batch):
+            self.dropped += len(batch) - room
+            batch = batch[len(batch) - room:] if room > 0 else []
+        self._buffer.extendleft(reversed(batch))
+
+    async def drain(self):
+        async with self._lock: # WHY: never cancel the task halfway through a flush
+            if self._task is not None:
+                self._task.cancel()
+                self._task = None
+        await self.flush()
+        if self._buffer:
+            logging.warning(f"writer <{self.name}> lost {len(self._buffer)} rows it could not flush")
+        logging.info(f"writer <{self.name}> drained ({self.flushed} rows written, {self.failed} failed flushes, {self.dropped} dropped)")
+
+    @classmethod
+    async def drain_all(cls):
+        await asyncio.gather(*[writer.drain() for writer in cls.writers.values()])
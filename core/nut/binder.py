@@ -0,0 +1,69 @@
+from typing import Callable
+import inspect
+
+from core.nut.error import ParameterParseException
+
+
+def _identity(x):
+    return x
+
+
+class Binder():
+    """Argument plan for a nut callback, worked out once from its signature.
+
+    Each step is a ``(name, kind, cast, required)`` tuple; ``bind`` only walks
+    the steps, so no introspection happens per message.
+    """
+
+    __slots__ = ("_steps",)
+
+    POSITIONAL_ONLY       = inspect.Parameter.POSITIONAL_ONLY
+    POSITIONAL_OR_KEYWORD = inspect.Parameter.POSITIONAL_OR_KEYWORD
+    VAR_POSITIONAL        = inspect.Parameter.VAR_POSITIONAL
+    KEYWORD_ONLY          = inspect.Parameter.KEYWORD_ONLY
+    VAR_KEYWORD           = inspect.Parameter.VAR_KEYWORD
+
+    def __init__(self, callback: Callable):
+        steps = []
+        for name, argument in inspect.signature(callback).parameters.items():
+            if name in ("self", "ctx"): continue
+            if argument.kind is self.VAR_KEYWORD: continue # they are already there, no action is needed
+            cast = _identity if argument.annotation is inspect._empty else argument.annotation
+            required = argument.default is inspect._empty
+            steps.append((name, argument.kind, cast, required))
+        self._steps = tuple(steps)
+
+    def bind(self, fullname: str, args: list, kwargs: dict) -> tuple[tuple, dict]:
+        iterargs = iter(args)
+        new_args = []
+
+        all_missing = []
+
+        subject = next(iterargs, None)
+        for name, kind, cast, required in self._steps:
+            if kind is self.POSITIONAL_OR_KEYWORD:
+                if subject is not None:
+                    new_args.append(cast(subject))
+                    subject = next(iterargs, None)
+                elif name in kwargs:
+                    kwargs[name] = cast(kwargs[name])
+                elif required:
+                    all_missing.append(name)
+            elif kind is self.VAR_POSITIONAL: # TODO maybe cast this somehow?
+                while subject is not None and not isinstance(subject, tuple):
+                    new_args.append(cast(subject))
+                    subject = next(iterargs, None)
+            elif kind is self.KEYWORD_ONLY:
+                if name in kwargs:
+                    kwargs[name] = cast(kwargs[name])
+            elif kind is self.POSITIONAL_ONLY:
+                if subject is None:
+                    all_missing.append(name)
+                else:
+                    new_args.append(subject)
+                    subject = next(iterargs, None)
+
+        if len(all_missing) > 0:
+            raise ParameterParseException(f"'{fullname}' missing required positional parameter(s) {str(all_missing)}")
+
+        return tuple(new_args), kwargs
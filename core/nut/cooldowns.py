@@ -0,0 +1,116 @@
+from typing import Hashable
+import heapq
+import time
+
+from core.config import COOLDOWNS
+from core.utils.keystore import connect_keystore
+from core.utils.logger import get_log
+
+logging = get_log(__name__)
+
+class LocalCooldowns():
+    """Cooldown table for this process, keyed by (nut fullname, scope key).
+
+    Expiries are on the monotonic clock and kept in a heap, so entries are dropped
+    as soon as their cooldown is over. Past ``capacity`` entries the ones closest
+    to expiring are evicted first.
+    """
+
+    def __init__(self, capacity: int = 50_000):
+        self.capacity = capacity
+        self._expiry: dict[Hashable, float] = {}
+        self._heap: list[tuple[float, Hashable]] = []
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+    def _expire(self, now: float):
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expiry, key = heapq.heappop(heap)
+            # NOTE: restamped keys leave their old expiry behind in the heap
+            if self._expiry.get(key) == expiry:
+                del self._expiry[key]
+
+    def _stamp(self, key: Hashable, expiry: float):
+        self._expiry[key] = expiry
+        heapq.heappush(self._heap, (expiry, key))
+
+        while len(self._expiry) > self.capacity:
+            expiry, key = heapq.heappop(self._heap)
+            if self._expiry.get(key) == expiry:
+                del self._expiry[key]
+                self.evictions += 1
+
+        if len(self._heap) > 2 * self.capacity: # too many stale entries
+            self._heap = [(expiry, key) for key, expiry in self._expiry.items()]
+            heapq.heapify(self._heap)
+
+    def remaining(self, key: Hashable) -> float:
+        now = time.monotonic()
+        self._expire(now)
+        expiry = self._expiry.get(key)
+        return 0 if expiry is None else expiry - now
+
+    async def acquire(self, key: Hashable, cooldown: float, force: bool = False) -> bool:
+        # True when the call may go through, the cooldown is restarted in that case
+        now = time.monotonic()
+        self._expire(now)
+        if not force and key in self._expiry:
+            return False
+        self._stamp(key, now + cooldown)
+        return True
+
+    async def close(self):
+        self._expiry.clear()
+        self._heap.clear()
+
+class SharedCooldowns():
+    """Cooldowns enforced across bot processes through a redis-like key store.
+
+    Every key is a ``SET NX PX``, whoever sets it first gets to run. If the store
+    can't be reached the local table takes over until it comes back.
+    """
+
+    def __init__(self, client, prefix: str = "dtpbot:cooldown:", fallback: LocalCooldowns = None):
+        self.client   = client
+        self.prefix   = prefix
+        self.fallback = fallback or LocalCooldowns()
+        self.failures = 0
+
+    def __len__(self) -> int:
+        return len(self.fallback)
+
+    def _name(self, key: Hashable) -> str:
+        return self.prefix + ':'.join(key) if isinstance(key, tuple) else self.prefix + str(key)
+
+    async def acquire(self, key: Hashable, cooldown: float, force: bool = False) -> bool:
+        try:
+            return bool(await self.client.set(self._name(key), 1, px=max(1, int(cooldown * 1000)), nx=not force))
+        except Exception as e:
+            self.failures += 1
+            logging.warning(f"shared cooldowns unavailable, using local ones: {e!r}")
+            return await self.fallback.acquire(key, cooldown, force)
+
+    async def close(self):
+        await self.client.close()
+
+_store: LocalCooldowns | SharedCooldowns = None
+
+def from_config(config: dict) -> LocalCooldowns | SharedCooldowns:
+    local = LocalCooldowns(config.get('capacity', 50_000))
+    if config.get('backend', 'local') == 'shared':
+        client = connect_keystore(config.get('url', 'memory://'))
+        return SharedCooldowns(client, config.get('prefix', "dtpbot:cooldown:"), local)
+    return local
+
+def get_cooldowns() -> LocalCooldowns | SharedCooldowns:
+    global _store
+    if _store is None:
+        _store = from_config(COOLDOWNS)
+    return _store
+
+def use_cooldowns(store: LocalCooldowns | SharedCooldowns):
+    global _store
+    _store = store
@@ -0,0 +1,99 @@
+from typing import TYPE_CHECKING, Iterator
+import re
+from re import _parser as sre_parse
+from re import _constants as sre_constants
+
+if TYPE_CHECKING:
+    from core.nut.nut import RegexNut
+
+
+def required_literal(pattern: re.Pattern) -> str | None:
+    """Longest literal run every match of ``pattern`` has to contain, if any."""
+    if pattern.flags & re.IGNORECASE:
+        return None # WHY: literal `in` checks are case sensitive
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return None
+
+    best = ''
+    run = []
+    # NOTE: only top level items are mandatory, anything nested may be skipped or branched over
+    for op, av in parsed:
+        if op is sre_constants.LITERAL:
+            run.append(chr(av))
+            continue
+        if len(run) > len(best):
+            best = ''.join(run)
+        run = []
+    if len(run) > len(best):
+        best = ''.join(run)
+    return best or None
+
+
+_NO_SUBSCRIPTIONS = frozenset()
+
+class RegexDispatcher():
+
+    def __init__(self):
+        self._literals: dict[str, list['RegexNut']] = {}
+        self._always: list['RegexNut'] = []
+        self._keys: dict['RegexNut', str | None] = {}
+        # channel -> gated nuts enabled there; ungated nuts run everywhere
+        self._subscriptions: dict[str, set['RegexNut']] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, nut: 'RegexNut') -> bool:
+        return nut in self._keys
+
+    def add(self, nut: 'RegexNut'):
+        if nut in self._keys:
+            return
+        literal = required_literal(nut.pattern)
+        self._keys[nut] = literal
+        if literal is None:
+            self._always.append(nut)
+        else:
+            self._literals.setdefault(literal, []).append(nut)
+
+    def remove(self, nut: 'RegexNut'):
+        if nut not in self._keys:
+            return
+        literal = self._keys.pop(nut)
+        if literal is None:
+            self._always.remove(nut)
+            return
+        nuts = self._literals[literal]
+        nuts.remove(nut)
+        if not nuts:
+            del self._literals[literal]
+
+    def subscribe(self, channel: str, nut: 'RegexNut'):
+        self._subscriptions.setdefault(channel, set()).add(nut)
+
+    def unsubscribe(self, channel: str, nut: 'RegexNut'):
+        nuts = self._subscriptions.get(channel)
+        if nuts is None:
+            return
+        nuts.discard(nut)
+        if not nuts:
+            del self._subscriptions[channel]
+
+    def subscribed(self, channel: str) -> frozenset['RegexNut']:
+        return frozenset(self._subscriptions.get(channel, _NO_SUBSCRIPTIONS))
+
+    def candidates(self, content: str) -> Iterator['RegexNut']:
+        yield from self._always
+        for literal, nuts in self._literals.items():
+            if literal in content:
+                yield from nuts
+
+    def matches(self, channel: str, content: str) -> Iterator[tuple['RegexNut', re.Match]]:
+        subscribed = self._subscriptions.get(channel, _NO_SUBSCRIPTIONS)
+        for nut in self.candidates(content):
+            if nut.gated and nut not in subscribed:
+                continue
+            if (match:=nut.pattern.search(content)) is not None:
+                yield nut, match
@@ -0,0 +1,111 @@
+from core.nut.error import ParameterParseException
+
+# NOTE: mirrors the old `-[a-zA-z]` class, which also let `_` through (admin params like `-_ch`)
+_PARAMETER_START = frozenset(chr(c) for c in range(ord('A'), ord('z') + 1))
+
+def _unescape(string: str, start: int, end: int) -> str:
+    # drops every '\' and keeps the character right after it; a trailing '\' is dropped
+    result = []
+    i = start
+    while True:
+        idx = string.find('\\', i, end)
+        if idx == -1:
+            result.append(string[i:end])
+            return ''.join(result)
+        result.append(string[i:idx])
+        if idx + 1 < end:
+            result.append(string[idx + 1])
+        i = idx + 2
+        if i >= end:
+            return ''.join(result)
+
+def _scan_bare(content: str, i: int, n: int) -> tuple[str, int]:
+    end = content.find(' ', i)
+    if end == -1:
+        end = n
+    if content.find('\\', i, end) == -1:
+        # fast path, nothing to unescape; split() cuts at any other isspace() char like the loop below
+        token = content[i:end].split(None, 1)[0]
+        return token, i + len(token)
+
+    result = []
+    while i < n:
+        c = content[i]
+        if c == '\\':
+            if i + 1 < n:
+                result.append(content[i + 1]) # escaped whitespace stays in the token
+            i += 2
+            continue
+        if c.isspace():
+            break
+        result.append(c)
+        i += 1
+    return ''.join(result), i
+
+def _scan_quoted(content: str, i: int, n: int) -> tuple[str, int] | None:
+    j = i + 1
+    while True:
+        end = content.find('"', j)
+        if end == -1:
+            return None # unterminated, the caller reads it as a bare token
+        slashes = 0
+        k = end - 1
+        while k > i and content[k] == '\\':
+            slashes += 1
+            k -= 1
+        if slashes % 2 == 0: # not escaped, so it closes the quote
+            break
+        j = end + 1
+
+    if slashes == 0 and content.find('\\', i + 1, end) == -1:
+        return content[i + 1:end], end + 1
+    return _unescape(content, i + 1, end), end + 1
+
+def lex_arguments(content: str) -> tuple[list[str], dict, dict]:
+    """Splits command content into positional args, `-named` params and `-_admin` params.
+
+    Quotes and `\\` escapes are resolved in the same pass; a named param with
+    no value following it is a flag (``True``).
+    """
+    args = []
+    kwargs = {}
+    awargs = {}
+
+    target = None
+    parameter = None
+    had_parameter = False
+
+    i = 0
+    n = len(content)
+    while i < n:
+        c = content[i]
+        if c.isspace():
+            i += 1
+            continue
+
+        start = i
+        # NOTE: like the old regex, an empty `""` or a quote that never closes is not a quoted
+        # argument but part of a bare one (`echo "hi` has to keep working)
+        quoted = None
+        if c == '"' and not content.startswith('""', i):
+            quoted = _scan_quoted(content, i, n)
+        if quoted is not None:
+            value, i = quoted
+        else:
+            value, i = _scan_bare(content, i, n)
+            if c == '-' and len(value) > 1 and value[1] in _PARAMETER_START: # named par
+                parameter = value[1:]
+                target = awargs if parameter[0] == '_' else kwargs
+                target[parameter] = True # for bool args
+                had_parameter = True
+                continue
+
+        if parameter is not None:
+            target[parameter] = value
+            parameter = None
+        elif had_parameter:
+            raise ParameterParseException(f"argument '{value}' at column {start + 1} comes after named parameters")
+        else:
+            args.append(value)
+
+    return args, kwargs, awargs
@@ -5,19 +5,22 @@ from enum import Enum, auto
 from abc import ABC
 from functools import wraps
 from itertools import chain
+from time import perf_counter_ns
 
 from zoneinfo import ZoneInfo
 import aiocron
 from twitchio.ext import commands
 from twitchio.ext.commands import Context
 
-from core.nut.error import ParameterParseException, DtpReturnableException
+from core.nut.error import DtpReturnableException
+from core.nut.binder import Binder
 from core.patches.context import switch_channel
-from core.utils.format import parse_escape_characters
+from core.nut.lexer import lex_arguments
 from core.utils.logger import get_log
+from core.utils.metrics import NutMetrics
 from core.nut.result import Result, ECODE
 from core.patches.context import new_context
-from core.nut.restrictions import get_priviledge, PRIVILEDGE
+from core.nut.restrictions import get_priviledge, compile_policies, PRIVILEDGE
 
 logging = get_log(__name__)
 
@@ -29,13 +32,26 @@ class Nut(ABC):
 
     _callback: Callable = None
     _acorn: 'Acorn' = None
+    _policies: list = None # restrict/cooldown/channel, outermost decorator first
+    _allowed: Callable = None
+    _metrics: NutMetrics = None
 
     def __call__(self, fun: Callable = None, name: str = None, **kwargs):
         self.initialize_function(fun, name, **kwargs)
         return self
 
     async def actuate(self, ctx: commands.Context, *args, **kwargs):
+        start = perf_counter_ns()
+        result = await self._actuate(ctx, *args, **kwargs)
+        if self._metrics is None:
+            self._metrics = NutMetrics.of(self.fullname)
+        self._metrics.record(result.code, start)
+        return result
+
+    async def _actuate(self, ctx: commands.Context, *args, **kwargs):
         try:
+            if self._allowed is not None and not await self._allowed(ctx):
+                return Result(ECODE.SILENT, None)
             result = await self.trigger(self.acorn, ctx, *args, **kwargs)
             if isinstance(result, Result):
                 return result
@@ -55,6 +71,13 @@ class Nut(ABC):
         self._name = name or fun.__name__
         return self
 
+    def add_policy(self, policy):
+        # NOTE: decorators apply bottom up, the last one added is the outermost
+        self._policies = [policy] + (self._policies or [])
+
+    def compile_policies(self):
+        self._allowed = compile_policies(self, self._policies or [])
+
     @classmethod
     def apply(cls, fun: 'Nut | Callable', *args, **kwargs):
         if isinstance(fun, Nut):
@@ -82,20 +105,36 @@ class Nut(ABC):
 
 class RegexNut(Nut):
     _regex: str = None
+    _pattern: re.Pattern = None
+    _gated: bool = False
 
-    def __init__(self, regex: str = r"""(?s).*""", **kwargs):
+    def __init__(self, regex: str = r"""(?s).*""", gated: bool = False, **kwargs):
+        # gated nuts only run in channels they were subscribed to (see Bot.subscribe_nut)
         self._regex = regex
+        self._pattern = re.compile(regex)
+        self._gated = gated
 
         def wrapper(fun):
             @wraps(fun)
-            async def run(acorn, ctx: Context, *args, **kwargs):
-                if (match:=re.search(self._regex, ctx.message.content)) is not None:
+            async def run(acorn, ctx: Context, *args, match: re.Match = None, **kwargs):
+                # NOTE: the bot's dispatcher already searched, only search when actuated directly
+                if match is None:
+                    match = self._pattern.search(ctx.message.content)
+                if match is not None:
                     return await fun(acorn, ctx, *args, match=match, **kwargs)
 
             return run
 
         self.trigger = wrapper(self.trigger)
 
+    @property
+    def pattern(self) -> re.Pattern:
+        return self._pattern
+
+    @property
+    def gated(self) -> bool:
+        return self._gated
+
     def register(self, acorn: 'Acorn', bot: 'Bot'):
         self.acorn = acorn
         bot.add_regex_nut(self)
@@ -113,10 +152,9 @@ class DEFAULT_ALIAS(Enum):
 
 class CommandNut(Nut):
 
-    #                            quoted arg (\ esc chr)   | named par       | regular arg
-    _parsing_commands_regex = r"""(".*?[^\\](?:\\\\)*(?=")")|(-[a-zA-z]\S*.*?)|(\S+.*?)"""
     _aliases: list[str] = None
     _default_aliases: DEFAULT_ALIAS = DEFAULT_ALIAS.BOTH_NAMES
+    _binder: Binder = None
 
     def __init__(self, aliases: list[str] = None, default_aliases: DEFAULT_ALIAS = DEFAULT_ALIAS.BOTH_NAMES, **kwargs):
         self._aliases = aliases
@@ -125,89 +163,17 @@ class CommandNut(Nut):
         def wrapper(fun):
             @wraps(fun)
             async def run(acorn, ctx: Context, *args, **kwargs):
-                matches = re.findall(self._parsing_commands_regex, ctx.message.content)
-                args, kwargs, awargs = self._reorganize_findall(matches)
+                args, kwargs, awargs = lex_arguments(ctx.message.content)
 
                 ctx = self.admin_kwargs(ctx, **awargs)
 
-                iterargs = iter(args)
-                new_args = []
-
-                all_missing = []
-
-                subject = next(iterargs, None)
-                for name, argument in inspect.signature(self._callback).parameters.items():
-                    if name in ("self", "ctx"): continue
-                    cast = (lambda x: x) if argument.annotation is inspect._empty else argument.annotation
-                    match argument.kind:
-                        case argument.POSITIONAL_ONLY:
-                            if subject is None:
-                                all_missing.append(name)
-                            else:
-                                new_args.append(subject)
-                                subject = next(iterargs, None)
-                        case argument.VAR_POSITIONAL: # TODO maybe cast this somehow?
-                            while subject is not None and not isinstance(subject, tuple):
-                                new_args.append(cast(subject))
-                                subject = next(iterargs, None)
-                            continue
-                        case argument.POSITIONAL_OR_KEYWORD:
-                            if subject is not None:
-                                new_args.append(cast(subject))
-                                subject = next(iterargs, None)
-                            elif name in kwargs.keys():
-                                kwargs[name] = cast(kwargs[name])
-                            elif argument.default is inspect._empty:
-                                all_missing.append(name)
-                        case argument.KEYWORD_ONLY:
-                            if name in kwargs.keys():
-                                kwargs[name] = cast(kwargs[name])
-                        case argument.VAR_KEYWORD: # TODO cast this somehow?
-                            pass # they are already there, no action is needed
-
-                if len(all_missing) > 0:
-                    raise ParameterParseException(f"'{self.fullname}' missing required positional parameter(s) {str(all_missing)}")
-
-                args = tuple(new_args)
+                args, kwargs = self._binder.bind(self.fullname, args, kwargs)
                 return await fun(acorn, ctx, *args, **kwargs)
 
             return run
 
         self.trigger = wrapper(self.trigger)
 
-    def _reorganize_findall(self, arguments):
-        res = []
-        for arg in arguments:
-            res.append(next((x, parse_escape_characters(y)) for x, y in enumerate(arg) if y != ''))
-
-        args = []
-        kwargs = {}
-
-        parameter = None
-        had_parameter = False
-        for argtype, argvalue in res:
-            match argtype:
-                case 0 | 2: # quoted arg | regular arg
-                    value = argvalue
-                    if argtype == 0: # quoted arg
-                        value = value[1:-1] # remove quotes
-                    if parameter is not None:
-                        kwargs[parameter] = value
-                        parameter = None
-                    elif had_parameter:
-                        raise ParameterParseException()
-                    else:
-                        args.append(value)
-                case 1: # named par
-                    value = argvalue[1:] # remove dash
-                    parameter = value
-                    kwargs[parameter] = True # for bool args
-                    had_parameter = True
-
-        awargs = {x: kwargs.pop(x) for x in list(kwargs.keys()) if x.startswith("_")} # admin args
-
-        return args, kwargs, awargs
-
     def admin_kwargs(self, ctx: commands.Context, **awargs):
         if get_priviledge(ctx) < PRIVILEDGE.ADMIN:
             return ctx
@@ -227,6 +193,7 @@ class CommandNut(Nut):
 
     def register(self, acorn: 'Acorn', bot: 'Bot'):
         self.acorn = acorn
+        self._binder = Binder(self._callback)
         if self._aliases is None:
             match self._default_aliases:
                 case DEFAULT_ALIAS.BOTH_NAMES:
@@ -1,11 +1,14 @@
+from typing import Awaitable, Callable, TYPE_CHECKING
 from enum import IntEnum
-from functools import wraps
-import datetime as dt
 
 from twitchio.ext import commands
 
+from core.config import GODS
 from core.utils.logger import get_log
-from core.nut.result import Result, ECODE
+from core.nut.cooldowns import get_cooldowns
+
+if TYPE_CHECKING:
+    from core.nut.nut import Nut
 
 logging = get_log(__name__)
 
@@ -25,11 +28,21 @@ class SCOPE(IntEnum):
     CHANNEL = 1
     GLOBAL = 2
 
-def get_priviledge(ctx: commands.Context):
-    if ctx.author.name == 'vexoulz': # TODO add this to db
+_gods: frozenset[str] = frozenset(GODS)
+_ambassadors: dict[str, frozenset[str]] = {} # channel -> ambassadors, see Channels.get_ambassadors
+
+def set_ambassadors(ambassadors: dict[str, list[str]]):
+    global _ambassadors
+    _ambassadors = {channel: frozenset(users) for channel, users in ambassadors.items() if users}
+
+def compute_priviledge(ctx: commands.Context) -> PRIVILEDGE:
+    name = ctx.author.name
+    if name in _gods:
         return PRIVILEDGE.ADMIN
     if ctx.author.is_broadcaster:
         return PRIVILEDGE.BROADCASTER
+    if name in _ambassadors.get(ctx.channel.name, ()):
+        return PRIVILEDGE.AMBASSADOR
     if ctx.author.is_mod:
         return PRIVILEDGE.MODERATOR
     if ctx.author.is_vip:
@@ -38,71 +51,88 @@ def get_priviledge(ctx: commands.Context):
         return PRIVILEDGE.SUBSCRIBER
     return PRIVILEDGE.PLEB
 
-
-def restrict(level: PRIVILEDGE):
+def get_priviledge(ctx: commands.Context) -> PRIVILEDGE:
+    # NOTE: resolved once per message, every nut and policy reuses it
+    priviledge = getattr(ctx, 'priviledge', None)
+    if priviledge is None:
+        priviledge = ctx.priviledge = compute_priviledge(ctx)
+    return priviledge
+
+
+class Gate():
+    # pure checks, consecutive restrict/channel policies are merged into one
+    __slots__ = ("level", "channels")
+
+    def __init__(self, level: PRIVILEDGE = PRIVILEDGE.PLEB, channels: frozenset[str] = None):
+        self.level    = level
+        self.channels = channels
+
+    def merge(self, other: 'Gate') -> 'Gate':
+        channels = self.channels
+        if other.channels is not None:
+            channels = other.channels if channels is None else channels & other.channels
+        return Gate(max(self.level, other.level), channels)
+
+class Cooldown():
+    __slots__ = ("cooldown", "exception", "scope")
+
+    def __init__(self, cooldown: int, exception: PRIVILEDGE, scope: SCOPE):
+        self.cooldown  = cooldown
+        self.exception = exception
+        self.scope     = scope
+
+    def key(self, nut: 'Nut', ctx: commands.Context) -> tuple[str, str]:
+        match self.scope:
+            case SCOPE.USER:
+                return (nut.fullname, f"{ctx.channel.name}.{ctx.author.name}")
+            case SCOPE.CHANNEL:
+                return (nut.fullname, ctx.channel.name)
+            case SCOPE.GLOBAL:
+                return (nut.fullname, "")
+
+def compile_policies(nut: 'Nut', policies: list[Gate | Cooldown]) -> Callable[[commands.Context], Awaitable[bool]] | None:
+    # policies are ordered outermost decorator first, like the wrappers they replace
+    stages: list[Gate | Cooldown] = []
+    for policy in policies:
+        if isinstance(policy, Gate) and stages and isinstance(stages[-1], Gate):
+            stages[-1] = stages[-1].merge(policy)
+        else:
+            stages.append(policy)
+    if not stages:
+        return None
+    stages = tuple(stages)
+
+    async def allowed(ctx: commands.Context) -> bool:
+        priviledge = get_priviledge(ctx)
+        for stage in stages:
+            if isinstance(stage, Gate):
+                if priviledge < stage.level:
+                    return False
+                if stage.channels is not None and ctx.channel.name not in stage.channels:
+                    return False
+            # NOTE: privileged users skip the cooldown but still restart it
+            elif not await get_cooldowns().acquire(stage.key(nut, ctx), stage.cooldown, force=priviledge >= stage.exception):
+                return False
+        return True
+
+    return allowed
+
+
+def _policy(policy: Gate | Cooldown):
     def deco(nut):
         from core.nut.nut import Nut
         if not isinstance(nut, Nut):
             raise TypeError("decorated object has to be nutty")
-
-        fun = nut.trigger
-        @wraps(fun)
-        async def wrapper(self, ctx: commands.Context, *args, **kwargs):
-            if get_priviledge(ctx) >= level:
-                return await fun(self, ctx, *args, **kwargs)
-            return Result(ECODE.SILENT, None)
-
-        nut.trigger = wrapper
+        nut.add_policy(policy)
         return nut
 
     return deco
 
+def restrict(level: PRIVILEDGE):
+    return _policy(Gate(level=level))
 
 def cooldown(cooldown: int, exception: PRIVILEDGE = PRIVILEDGE.MODERATOR, scope: SCOPE = SCOPE.CHANNEL):
-    def deco(nut):
-        from core.nut.nut import Nut
-        if not isinstance(nut, Nut):
-            raise TypeError("decorated object has to be nutty")
-
-        fun = nut.trigger
-        @wraps(fun)
-        async def wrapper(self, ctx: commands.Context, *args, **kwargs):
-            match scope:
-                case SCOPE.USER:
-                    varname = f"{ctx.channel.name}.{ctx.author.name}.lastcall"
-                case SCOPE.CHANNEL:
-                    varname = f"{ctx.channel.name}.lastcall"
-                case SCOPE.GLOBAL:
-                    varname = f"lastcall"
-
-            if varname not in nut.__dict__.keys():
-                nut.__dict__[varname] = dt.datetime.min
-
-            now = dt.datetime.now()
-            if get_priviledge(ctx) >= exception or (now - nut.__dict__[varname]).total_seconds() > cooldown:
-                nut.__dict__[varname] = now
-                return await fun(self, ctx, *args, **kwargs)
-            return Result(ECODE.SILENT, None)
-
-        nut.trigger = wrapper
-        return nut
-
-    return deco
+    return _policy(Cooldown(cooldown, exception, scope))
 
 def channel(channels: list[str]):
-    def deco(nut):
-        from core.nut.nut import Nut
-        if not isinstance(nut, Nut):
-            raise TypeError("decorated object has to be nutty")
-
-        fun = nut.trigger
-        @wraps(fun)
-        async def wrapper(self, ctx: commands.Context, *args, **kwargs):
-            if ctx.channel.name in channels:
-                return await fun(self, ctx, *args, **kwargs)
-            return Result(ECODE.SILENT, None)
-
-        nut.trigger = wrapper
-        return nut
-
-    return deco
+    return _policy(Gate(channels=frozenset(channels)))
@@ -34,7 +34,7 @@ class TwitchHTTPWrapper(TwitchHTTP):
         self.auths.client_secret = self.client_secret
         self.auths.refresh_token = self._refresh_token
         self.auths.token         = self.token
-        self.auths.save()
+        await self.auths.asave()
         self.client._connection._token = self.token # TODO: do this in a nicer way
         return redirecter
     
@@ -6,6 +6,7 @@ from twitchio.channel import Channel
 from twitchio.chatter import WhisperChatter
 
 from core.utils.logger import get_log
+from core.pipeline.delivery import DeliveryTracker
 
 if TYPE_CHECKING:
     from core.bot import Bot
@@ -14,6 +15,32 @@ logging = get_log(__name__)
 
 class WSConnectionWrapper(WSConnection):
 
+    _delivery: DeliveryTracker = None
+
+    # FACADE: remember every PRIVMSG so twitch's answer to it can be matched
+    # WHY: twitchio fakes the PRIVMSG(ECHO) locally right here, before the message even hits the socket
+    async def send(self, message: str):
+        if self._delivery is not None and message.startswith("PRIVMSG #"):
+            self._delivery.sent(message[9:].split(' ', 1)[0])
+        await super().send(message)
+
+    # FACADE: twitch sends a USERSTATE for every PRIVMSG it accepted
+    async def _userstate_ack(self, parsed):
+        if self._delivery is not None:
+            self._delivery.acknowledged(parsed["channel"])
+        await self._userstate(parsed)
+
+    # FACADE: and a msg_* NOTICE for every PRIVMSG it refused
+    async def _notice_ack(self, parsed):
+        if self._delivery is not None and parsed.get("channel"):
+            try:
+                msg_id = parsed["groups"][0].split("=")[1]
+            except (KeyError, IndexError):
+                msg_id = None
+            if msg_id and msg_id.startswith("msg_"):
+                self._delivery.rejected(parsed["channel"], msg_id)
+        await self._notice(parsed)
+
     # FACADE: wrapper to properly parse PONG messages and not just ignore them
     async def _process_data(self, data: str):
         groups = data.split()
@@ -49,10 +76,13 @@ class WSConnectionWrapper(WSConnection):
         self.dispatch("pong", parsed)
 
     # FACADE: add new actions
-    def initialize(self):
+    def initialize(self, delivery: DeliveryTracker = None):
+        self._delivery = delivery
         self._actions["PRIVMSG(ECHO)"] = self._privmsg_echo
         self._actions["PONG"] = self._pong
+        self._actions["USERSTATE"] = self._userstate_ack
+        self._actions["NOTICE"] = self._notice_ack
 
 def apply_websocket_patch(bot: 'Bot'):
     bot._connection.__class__ = WSConnectionWrapper
-    WSConnectionWrapper.initialize(bot._connection)
+    WSConnectionWrapper.initialize(bot._connection, bot.delivery)
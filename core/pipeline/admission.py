@@ -0,0 +1,56 @@
+from enum import IntEnum
+
+from core.utils.logger import get_log
+
+logging = get_log(__name__)
+
+class PRIORITY(IntEnum):
+    COMMAND   = 0
+    MODERATOR = 1
+    PASSIVE   = 2
+
+class AdmissionController():
+    """Decides whether a message gets queued at all.
+
+    Commands and moderator messages are always admitted. Passive work is
+    sampled (1 of every ``sample_every``) past the soft depth thresholds and
+    shed entirely past the hard ones.
+    """
+
+    def __init__(self, channel_soft: int = 50, channel_hard: int = 150, global_soft: int = 500, global_hard: int = 2_000, sample_every: int = 10):
+        self.channel_soft = channel_soft
+        self.channel_hard = channel_hard
+        self.global_soft  = global_soft
+        self.global_hard  = global_hard
+        self.sample_every = sample_every
+
+        self._sample_counter: dict[str, int] = {}
+        self.shed: dict[str, int] = {}
+        self.sampled: dict[str, int] = {}
+
+    def admit(self, channel: str, priority: PRIORITY, channel_depth: int, global_depth: int) -> bool:
+        if priority < PRIORITY.PASSIVE:
+            return True
+
+        if channel_depth >= self.channel_hard or global_depth >= self.global_hard:
+            self.shed[channel] = self.shed.get(channel, 0) + 1
+            return False
+
+        if channel_depth >= self.channel_soft or global_depth >= self.global_soft:
+            counter = self._sample_counter.get(channel, 0) + 1
+            self._sample_counter[channel] = counter % self.sample_every
+            if counter < self.sample_every:
+                self.shed[channel] = self.shed.get(channel, 0) + 1
+                return False
+            self.sampled[channel] = self.sampled.get(channel, 0) + 1
+            return True
+
+        self._sample_counter.pop(channel, None)
+        return True
+
+    @property
+    def total_shed(self) -> int:
+        return sum(self.shed.values())
+
+    def most_shed(self, n: int = 5) -> list[tuple[str, int]]:
+        return sorted(self.shed.items(), key=lambda x: x[1], reverse=True)[:n]
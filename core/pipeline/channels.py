@@ -0,0 +1,132 @@
+from typing import Any, Awaitable, Callable
+from collections import deque
+from itertools import count
+import asyncio
+
+from core.utils.logger import get_log
+
+logging = get_log(__name__)
+
+URGENT = 0
+NORMAL = 1
+
+class ChannelQueue():
+
+    __slots__ = ("items", "urgent")
+
+    def __init__(self):
+        self.items: deque[tuple[bool, Any]] = deque()
+        self.urgent = 0 # urgent items still queued
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def append(self, item: Any, urgent: bool):
+        self.items.append((urgent, item))
+        self.urgent += urgent
+
+    def popleft(self) -> Any:
+        urgent, item = self.items.popleft()
+        self.urgent -= urgent
+        return item
+
+class ChannelDispatcher():
+    """One ordered queue per channel, drained by a shared pool of workers.
+
+    A channel is handed to at most one worker at a time, so items of the same
+    channel are handled strictly in order while different channels run in parallel.
+    Urgent items only make their channel go before others, never ahead of older
+    items in it (pyramid detection relies on seeing every message in order).
+    """
+
+    def __init__(self, handler: Callable[[Any], Awaitable], workers: int = 8, max_depth: int = 200):
+        self._handler   = handler
+        self._n_workers = workers
+        self.max_depth  = max_depth
+
+        self._queues: dict[str, ChannelQueue] = {}
+        self._ready: asyncio.PriorityQueue[tuple[int, int, str]] = asyncio.PriorityQueue()
+        self._sequence = count()
+        self._pending: dict[str, int] = {} # channel -> best priority waiting in _ready
+        self._running: set[str] = set()
+        self._workers: list[asyncio.Task] = []
+        self._depth = 0 # items queued over all channels, admission control reads it on every message
+
+        self.high_water: dict[str, int] = {}
+        self.dropped: dict[str, int] = {}
+
+    def start(self):
+        if self._workers:
+            return
+        loop = asyncio.get_running_loop()
+        self._workers = [loop.create_task(self._work()) for _ in range(self._n_workers)]
+        logging.info(f"channel dispatcher started with {self._n_workers} workers")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, channel: str, item: Any, urgent: bool = False) -> bool:
+        queue = self._queues.get(channel)
+        if queue is None:
+            queue = self._queues[channel] = ChannelQueue()
+
+        if len(queue) >= self.max_depth:
+            self.dropped[channel] = self.dropped.get(channel, 0) + 1
+            return False
+
+        queue.append(item, urgent)
+        self._depth += 1
+        if len(queue) > self.high_water.get(channel, 0):
+            self.high_water[channel] = len(queue)
+
+        self._schedule(channel, URGENT if urgent else NORMAL)
+        return True
+
+    def _schedule(self, channel: str, priority: int):
+        if channel in self._running:
+            return # the worker holding it reschedules once it is done
+        if self._pending.get(channel, NORMAL + 1) <= priority:
+            return
+        self._pending[channel] = priority
+        self._ready.put_nowait((priority, next(self._sequence), channel))
+
+    async def _work(self):
+        while True:
+            priority, _, channel = await self._ready.get()
+            if channel in self._running or self._pending.get(channel) != priority:
+                continue # stale entry, superseded by a more urgent one
+            del self._pending[channel]
+            self._running.add(channel)
+
+            queue = self._queues[channel]
+            item = queue.popleft()
+            self._depth -= 1
+            try:
+                await self._handler(item)
+            except Exception:
+                logging.exception(f"#{channel} | unhandled exception while dispatching")
+            finally:
+                self._running.discard(channel)
+
+            # back of the line, other channels get their turn
+            if queue.urgent:
+                self._schedule(channel, URGENT)
+            elif queue.items:
+                self._schedule(channel, NORMAL)
+            else:
+                del self._queues[channel]
+
+    def depth(self, channel: str) -> int:
+        queue = self._queues.get(channel)
+        return 0 if queue is None else len(queue)
+
+    @property
+    def total_depth(self) -> int:
+        return self._depth
+
+    def lagging(self, n: int = 5) -> list[tuple[str, int]]:
+        depths = [(channel, len(queue)) for channel, queue in self._queues.items()]
+        return sorted(depths, key=lambda x: x[1], reverse=True)[:n]
@@ -0,0 +1,89 @@
+from collections import deque
+from time import perf_counter_ns
+
+from core.utils.logger import get_log
+from core.utils.metrics import RollingHistogram
+
+logging = get_log(__name__)
+
+class ChannelDelivery():
+
+    __slots__ = ("pending", "latency", "sent", "delivered", "rejected", "silent", "reasons")
+
+    def __init__(self, window: float):
+        self.pending: deque[int] = deque() # perf_counter_ns of PRIVMSGs not acknowledged yet
+        self.latency   = RollingHistogram(window)
+        self.sent      = 0
+        self.delivered = 0
+        self.rejected  = 0
+        self.silent    = 0
+        self.reasons: dict[str, int] = {}
+
+    @property
+    def drop_rate(self) -> float:
+        settled = self.delivered + self.rejected + self.silent
+        return (self.rejected + self.silent) / settled if settled else 0
+
+class DeliveryTracker():
+    """Matches our PRIVMSGs with what twitch answers to them.
+
+    Twitch answers every accepted PRIVMSG with a USERSTATE for that channel, and a
+    rejected one with a NOTICE (msg_ratelimit, msg_duplicate, ...). Both come back
+    in send order, so the oldest pending message of the channel is the one being
+    answered. Messages left unanswered for ``timeout`` seconds count as silent drops.
+    """
+
+    def __init__(self, timeout: float = 10, window: float = 300):
+        self.timeout = int(timeout * 1e9)
+        self.window  = window
+        self._channels: dict[str, ChannelDelivery] = {}
+
+    def channel(self, channel: str) -> ChannelDelivery:
+        delivery = self._channels.get(channel)
+        if delivery is None:
+            delivery = self._channels[channel] = ChannelDelivery(self.window)
+        return delivery
+
+    def _expire(self, channel: str, delivery: ChannelDelivery, now: int):
+        pending = delivery.pending
+        while pending and now - pending[0] > self.timeout:
+            pending.popleft()
+            delivery.silent += 1
+            logging.warning(f"#{channel} | PRIVMSG never acknowledged by twitch after {self.timeout / 1e9:.0f}s")
+
+    def sent(self, channel: str):
+        delivery = self.channel(channel)
+        delivery.pending.append(perf_counter_ns())
+        delivery.sent += 1
+
+    def acknowledged(self, channel: str):
+        delivery = self._channels.get(channel)
+        if delivery is None:
+            return # NOTE: USERSTATE on join, nothing was sent there yet
+        now = perf_counter_ns()
+        self._expire(channel, delivery, now)
+        if delivery.pending:
+            delivery.latency.record(now - delivery.pending.popleft(), now)
+            delivery.delivered += 1
+
+    def rejected(self, channel: str, reason: str):
+        delivery = self._channels.get(channel)
+        if delivery is None:
+            return
+        self._expire(channel, delivery, perf_counter_ns())
+        if delivery.pending:
+            delivery.pending.popleft()
+            delivery.rejected += 1
+            delivery.reasons[reason] = delivery.reasons.get(reason, 0) + 1
+            logging.warning(f"#{channel} | PRIVMSG rejected by twitch: {reason}")
+
+    def expire(self):
+        now = perf_counter_ns()
+        for channel, delivery in self._channels.items():
+            self._expire(channel, delivery, now)
+
+    def items(self):
+        return self._channels.items()
+
+    def worst(self, n: int = 5) -> list[tuple[str, ChannelDelivery]]:
+        return sorted(self._channels.items(), key=lambda x: (x[1].drop_rate, x[1].latency.percentiles(0.99)[0]), reverse=True)[:n]
@@ -0,0 +1,188 @@
+from typing import Awaitable, Callable
+from enum import IntEnum
+from itertools import count
+import asyncio
+import heapq
+import time
+
+from core.utils.logger import get_log
+from core.utils.startup import timeline
+from core.pipeline.outbound import TokenBucket
+
+logging = get_log(__name__)
+
+class JOIN_PRIORITY(IntEnum):
+    OWN       = 0 # the bot's own channel
+    LIVE      = 1
+    REQUESTED = 2 # joined through a command
+    NORMAL    = 3
+    RETRY     = 4
+
+class JoinScheduler():
+    """Joins channels under Twitch's JOIN rate limit, best priority first.
+
+    Channels are sent in batches (one ``JOIN #a,#b,...`` line) as long as the
+    bucket has tokens, one token per channel. A channel only counts as joined
+    once our own JOIN comes back (see Bot.event_join); the ones that don't
+    within ``timeout`` seconds are retried up to ``max_attempts`` times.
+    """
+
+    def __init__(self, send: Callable[[str], Awaitable], limits: dict = None):
+        limits = limits or {}
+        self._send  = send
+        self._bucket = TokenBucket(limits.get('rate', 20), limits.get('period', 10))
+        self.batch        = limits.get('batch', 10)
+        self.timeout      = limits.get('timeout', 15)
+        self.max_attempts = limits.get('max_attempts', 3)
+
+        self.wanted: dict[str, JOIN_PRIORITY] = {} # channel -> base priority
+        self.joined: set[str] = set()
+        self.pending: dict[str, float] = {}       # channel -> monotonic time the JOIN was sent
+        self.attempts: dict[str, int] = {}
+        self.failed: set[str] = set()
+        self.settled = False # every channel wanted at startup was joined once
+
+        self._heap: list[tuple[int, int, str]] = []
+        self._queued: dict[str, int] = {} # channel -> best priority in the heap
+        self._sequence = count()
+        self._waiters: dict[str, list[asyncio.Future]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task = None
+
+    @property
+    def queued(self) -> int:
+        return len(self._queued)
+
+    def _push(self, channel: str, priority: int):
+        if self._queued.get(channel, JOIN_PRIORITY.RETRY + 1) <= priority:
+            return
+        self._queued[channel] = priority
+        heapq.heappush(self._heap, (priority, next(self._sequence), channel))
+        self._wakeup.set()
+
+    def want(self, channels: list[str], priority: JOIN_PRIORITY = JOIN_PRIORITY.NORMAL):
+        for channel in channels:
+            self.wanted[channel] = min(priority, self.wanted.get(channel, priority))
+            self.failed.discard(channel)
+            if channel not in self.joined and channel not in self.pending:
+                self._push(channel, priority)
+        self._start()
+
+    def prioritise(self, channels: list[str], priority: JOIN_PRIORITY):
+        # e.g. live channels found while the queue is already draining
+        for channel in channels:
+            if channel in self._queued:
+                self._push(channel, priority)
+
+    def forget(self, channel: str):
+        self.wanted.pop(channel, None)
+        self.joined.discard(channel)
+        self.pending.pop(channel, None)
+        self._queued.pop(channel, None) # NOTE: its heap entry is skipped as stale
+        self.attempts.pop(channel, None)
+        self.failed.discard(channel)
+
+    def reconnected(self):
+        # a new connection starts without any channel, everything goes back in line
+        self.joined.clear()
+        self.pending.clear()
+        self.attempts.clear()
+        self.failed.clear()
+        for channel, priority in self.wanted.items():
+            self._push(channel, priority)
+        self._start()
+
+    def confirm(self, channel: str):
+        if channel not in self.wanted:
+            return
+        self.pending.pop(channel, None)
+        self.attempts.pop(channel, None)
+        self.failed.discard(channel) # a late confirmation still counts
+        self.joined.add(channel)
+        for waiter in self._waiters.pop(channel, []):
+            if not waiter.done():
+                waiter.set_result(True)
+        if not self.settled and not self._queued and not self.pending:
+            self.settled = True # NOTE: only the first time, later joins are not startup
+            timeline.mark("all channels joined")
+
+    async def wait_joined(self, channel: str, timeout: float = None) -> bool:
+        if channel in self.joined:
+            return True
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(channel, []).append(waiter)
+        try:
+            async with asyncio.timeout(timeout):
+                return await waiter
+        except TimeoutError:
+            return False
+
+    def eta(self) -> float:
+        # seconds until everything queued was at least sent
+        return self.queued / self._bucket.rate
+
+    def _start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _expire(self, now: float) -> float | None:
+        # retries JOINs twitch never confirmed, returns when the next one times out
+        next_expiry = None
+        for channel, sent in list(self.pending.items()):
+            if now - sent < self.timeout:
+                expiry = sent + self.timeout - now
+                next_expiry = expiry if next_expiry is None else min(next_expiry, expiry)
+                continue
+            del self.pending[channel]
+            if self.attempts.get(channel, 0) >= self.max_attempts:
+                self.failed.add(channel)
+                logging.warning(f"#{channel} | giving up joining after {self.attempts[channel]} attempts")
+            else:
+                self._push(channel, JOIN_PRIORITY.RETRY)
+        return next_expiry
+
+    def _pop_batch(self, size: int) -> list[str]:
+        batch = []
+        while self._heap and len(batch) < size:
+            priority, _, channel = heapq.heappop(self._heap)
+            if self._queued.get(channel) != priority:
+                continue # stale, superseded or forgotten
+            del self._queued[channel]
+            batch.append(channel)
+        return batch
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now  = time.monotonic()
+            wait = self._expire(now)
+
+            if self._queued:
+                # NOTE: waits for a full batch worth of tokens instead of trickling single channel JOINs
+                needed = self._bucket.wait_time(now, min(self.batch, self.queued, self._bucket.capacity))
+                if needed == 0:
+                    batch = self._pop_batch(min(self.batch, int(self._bucket.tokens)))
+                    if batch:
+                        for channel in batch:
+                            self._bucket.take(now)
+                            self.pending[channel] = now
+                            self.attempts[channel] = self.attempts.get(channel, 0) + 1
+                        try:
+                            await self._send(f"JOIN {','.join('#' + channel for channel in batch)}")
+                        except Exception:
+                            logging.exception(f"failed to send JOIN for {batch}")
+                    continue
+                wait = needed if wait is None else min(wait, needed)
+            elif not self.pending:
+                wait = None # idle until something new is wanted
+
+            try:
+                async with asyncio.timeout(wait):
+                    await self._wakeup.wait()
+            except TimeoutError:
+                pass
@@ -0,0 +1,193 @@
+from typing import TYPE_CHECKING
+from enum import IntEnum
+from collections import deque
+import asyncio
+import time
+from time import perf_counter_ns
+
+from core.utils.logger import get_log
+from core.pipeline.tracing import Trace, current_trace
+from core.utils.startup import timeline
+
+if TYPE_CHECKING:
+    from twitchio.ext import commands
+
+logging = get_log(__name__)
+
+class SEND_PRIORITY(IntEnum):
+    REPLY   = 0 # answers to commands
+    PASSIVE = 1 # things the bot says on its own (facts, GRATS)
+
+class TokenBucket():
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, period: float):
+        self.capacity = capacity
+        self.rate     = capacity / period # tokens per second
+        self.tokens   = capacity
+        self.updated  = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens  = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float, amount: float = 1) -> float:
+        self._refill(now)
+        if self.tokens >= amount:
+            return 0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+class OutboundMessage():
+
+    __slots__ = ("ctx", "channel", "content", "priority", "enqueued", "deadline", "trace")
+
+    def __init__(self, ctx: 'commands.Context', content: str, priority: SEND_PRIORITY, ttl: float):
+        self.ctx      = ctx
+        self.channel  = ctx.channel.name
+        self.content  = content
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.deadline = self.enqueued + ttl
+        self.trace: Trace = current_trace.get()
+        if self.trace is not None:
+            self.trace.pending += 1
+
+class OutboundScheduler():
+    """Sends PRIVMSGs while staying under Twitch's rate limits.
+
+    Every message spends a token from the global bucket and, in channels where the
+    bot is not mod/VIP, from that channel's bucket too. Replies go before passive
+    messages, and anything that waited past its deadline is dropped instead of sent late.
+    """
+
+    def __init__(self, limits: dict = None):
+        limits = limits or {}
+        self._global_regular  = TokenBucket(limits.get('global_regular', 20),   limits.get('period', 30))
+        self._global_elevated = TokenBucket(limits.get('global_elevated', 100), limits.get('period', 30))
+        self._channel_period  = limits.get('channel_period', 1.1) # slow mode-ish gap for non mods
+        self._ttl = {
+            SEND_PRIORITY.REPLY  : limits.get('reply_ttl', 30),
+            SEND_PRIORITY.PASSIVE: limits.get('passive_ttl', 10),
+        }
+
+        self._lanes: list[deque[OutboundMessage]] = [deque() for _ in SEND_PRIORITY]
+        self._channel_buckets: dict[str, TokenBucket] = {}
+        self._elevated: set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task = None
+        self._sending = False
+        self.drain_timeout = limits.get('drain_timeout', 5)
+
+        self.sent    = {priority: 0 for priority in SEND_PRIORITY}
+        self.expired = {priority: 0 for priority in SEND_PRIORITY}
+        self.wait_times = {priority: deque(maxlen=500) for priority in SEND_PRIORITY} # seconds
+
+    def set_elevated(self, channel: str, elevated: bool):
+        if elevated:
+            self._elevated.add(channel)
+            self._channel_buckets.pop(channel, None)
+        else:
+            self._elevated.discard(channel)
+
+    def is_elevated(self, channel: str) -> bool:
+        return channel in self._elevated
+
+    @property
+    def depth(self) -> int:
+        return sum(len(lane) for lane in self._lanes)
+
+    def enqueue(self, ctx: 'commands.Context', content: str, priority: SEND_PRIORITY = SEND_PRIORITY.REPLY) -> OutboundMessage:
+        message = OutboundMessage(ctx, content, priority, self._ttl[priority])
+        self._lanes[priority].append(message)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        self._wakeup.set()
+        return message
+
+    async def stop(self):
+        # WHY: replies were already accepted, give them a few seconds to go out before giving up on them
+        deadline = time.monotonic() + self.drain_timeout
+        while self._task is not None and not self._task.done() and (self.depth or self._sending) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        lost = 0
+        for lane in self._lanes:
+            for message in lane:
+                if message.trace is not None:
+                    message.trace.release()
+            lost += len(lane)
+            lane.clear()
+        if lost:
+            logging.warning(f"outbound stopped with {lost} messages still queued")
+
+    def _buckets(self, channel: str) -> tuple[TokenBucket, ...]:
+        if channel in self._elevated:
+            return (self._global_elevated,)
+        bucket = self._channel_buckets.get(channel)
+        if bucket is None:
+            bucket = self._channel_buckets[channel] = TokenBucket(1, self._channel_period)
+        return (bucket, self._global_regular, self._global_elevated)
+
+    def _next(self, now: float) -> tuple[OutboundMessage | None, float | None]:
+        wait = None
+        blocked = set() # WHY: keep per channel order, a blocked channel blocks its later messages too
+        for lane in self._lanes:
+            i = 0
+            while i < len(lane):
+                message = lane[i]
+                if message.deadline < now:
+                    del lane[i]
+                    self.expired[message.priority] += 1
+                    if message.trace is not None:
+                        message.trace.release()
+                    logging.warning(f"#{message.channel} | dropped stale message after {now - message.enqueued:.1f}s: {message.content}")
+                    continue
+                if message.channel not in blocked:
+                    buckets = self._buckets(message.channel)
+                    needed = max(bucket.wait_time(now) for bucket in buckets)
+                    if needed == 0:
+                        del lane[i]
+                        for bucket in buckets:
+                            bucket.take(now)
+                        return message, None
+                    blocked.add(message.channel)
+                    wait = needed if wait is None else min(wait, needed)
+                i += 1
+        return None, wait
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            message, wait = self._next(now)
+            if message is None:
+                try:
+                    async with asyncio.timeout(wait):
+                        await self._wakeup.wait()
+                except TimeoutError:
+                    pass
+                continue
+
+            self.wait_times[message.priority].append(now - message.enqueued)
+            start = perf_counter_ns()
+            self._sending = True
+            try:
+                await message.ctx.send(message.content)
+                self.sent[message.priority] += 1
+                if message.trace is not None:
+                    timeline.mark("first reply") # to a chat message, the time we get paged on
+            except Exception:
+                logging.exception(f"#{message.channel} | failed to send: {message.content}")
+            finally:
+                self._sending = False
+                if message.trace is not None:
+                    message.trace.record("outbound", int((now - message.enqueued) * 1e9))
+                    message.trace.record("send", perf_counter_ns() - start)
+                    message.trace.release()
@@ -0,0 +1,139 @@
+import asyncio
+import multiprocessing
+
+from core.utils.logger import get_log
+from core.utils.hashring import HashRing
+from core.utils.sharedstate import InProcessState, RedisState, connect_state
+from core.database.settings import Channels
+from core.database.sql import unit_of_work
+
+logging = get_log(__name__)
+
+COORDINATOR_TOPIC = "shards:coordinator"
+
+def shard_topic(shard: str) -> str:
+    return f"shards:{shard}"
+
+def shard_names(config: dict) -> list[str]:
+    return [f"shard{i}" for i in range(config.get('count', 1))]
+
+def share_limits(limits: dict, defaults: dict[str, float], shards: int) -> dict:
+    # WHY: twitch rate limits are per account, every connection only gets its share
+    return {**limits, **{key: limits.get(key, default) / shards for key, default in defaults.items()}}
+
+class ShardCoordinator():
+    """Owns joins and parts while the bot runs as several shard processes.
+
+    Channels belong to the shard the hash ring picks, and only the coordinator's
+    ring counts: a shard carries what it was assigned on hello plus later joins.
+    Shards ask the coordinator to join or part (it writes the channel table and
+    tells the owner), and when a shard goes away or comes back only the channels
+    whose owner changed move.
+    """
+
+    def __init__(self, state: InProcessState | RedisState, shards: list[str], replicas: int = 64):
+        self.state = state
+        self.ring = HashRing(shards, replicas)
+        self.channels: set[str] = set()
+
+    async def start(self):
+        self.channels = set(await Channels.aget_active_channels())
+        await self.state.subscribe(COORDINATOR_TOPIC, self.on_message)
+        logging.info(f"coordinating {len(self.channels)} channels over {len(self.ring.nodes)} shards")
+
+    async def on_message(self, payload: dict):
+        match payload['op']:
+            case 'join':
+                await self.join(payload['channels'])
+            case 'part':
+                await self.part(payload['channels'])
+            case 'hello':
+                await self.hello(payload['shard'])
+
+    async def _send(self, op: str, assignments: dict[str, list[str]]):
+        for shard, channels in assignments.items():
+            if channels:
+                await self.state.publish(shard_topic(shard), {'op': op, 'channels': channels})
+
+    async def join(self, channels: list[str]):
+        joined = [channel for channel in dict.fromkeys(channels) if channel not in self.channels]
+        if not joined:
+            return
+        await Channels.aupsert_active(joined)
+        self.channels.update(joined)
+        await self._send('join', self.ring.partition(joined))
+
+    async def part(self, channels: list[str]):
+        parted = [channel for channel in dict.fromkeys(channels) if channel in self.channels]
+        # NOTE: every row goes before an owner is told to part
+        async with unit_of_work():
+            for channel in parted:
+                await Channels.apart(channel)
+        self.channels.difference_update(parted)
+        await self._send('part', self.ring.partition(parted))
+
+    async def _rebalance(self, change):
+        before = {channel: self.ring.node(channel) for channel in self.channels}
+        change()
+        parts, joins = {}, {}
+        for channel, old in before.items():
+            new = self.ring.node(channel)
+            if new != old:
+                parts.setdefault(old, []).append(channel)
+                joins.setdefault(new, []).append(channel)
+        # NOTE: parts first, a channel may be briefly joined by nobody but never twice
+        await self._send('part', parts)
+        await self._send('join', joins)
+        logging.info(f"rebalanced {sum(len(x) for x in joins.values())} channels over {sorted(self.ring.nodes)}")
+
+    async def hello(self, shard: str):
+        # a (re)started shard carries nothing until it gets its whole slice, after the parts on the others went out
+        await self.add_shard(shard)
+        owned = [channel for channel in self.channels if self.ring.node(channel) == shard]
+        await self.state.publish(shard_topic(shard), {'op': 'assign', 'channels': owned})
+
+    async def add_shard(self, shard: str):
+        if shard not in self.ring.nodes:
+            await self._rebalance(lambda: self.ring.add(shard))
+
+    async def remove_shard(self, shard: str):
+        if shard in self.ring.nodes and len(self.ring.nodes) > 1:
+            await self._rebalance(lambda: self.ring.remove(shard))
+
+def run_shard(user_id: str, shard: str):
+    # NOTE: runs in a spawned process, the bot (and its db pool) only exists there
+    from core.bot import Bot
+    Bot(user_id, shard).run()
+
+async def supervise(user_id: str, config: dict):
+    shards = shard_names(config)
+    state = connect_state(config.get('state', 'memory://'), config.get('prefix', "dtpbot:"))
+    if isinstance(state, InProcessState):
+        raise ValueError("shard processes can't share an in process state, SHARDS.state must be a redis url")
+
+    coordinator = ShardCoordinator(state, shards, config.get('replicas', 64))
+    await coordinator.start()
+
+    context = multiprocessing.get_context('spawn')
+    def spawn(shard: str) -> multiprocessing.Process:
+        process = context.Process(target=run_shard, args=(user_id, shard), name=shard)
+        process.start()
+        return process
+
+    processes = {shard: spawn(shard) for shard in shards}
+    try:
+        while True:
+            await asyncio.sleep(config.get('check_interval', 5))
+            for shard, process in processes.items():
+                if process.is_alive():
+                    continue
+                # its channels go to the other shards until it says hello again
+                logging.warning(f"{shard} exited with code {process.exitcode}, restarting it")
+                await coordinator.remove_shard(shard)
+                processes[shard] = spawn(shard)
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(10)
+        await state.close()
@@ -0,0 +1,112 @@
+from typing import TYPE_CHECKING
+from contextvars import ContextVar
+from collections import deque
+from time import perf_counter_ns, time_ns
+import json
+
+from core.utils.logger import get_log
+from core.utils.metrics import RollingHistogram
+
+if TYPE_CHECKING:
+    from twitchio.message import Message
+
+logging = get_log(__name__)
+
+# network: tmi-sent-ts to event_message, queue: waiting for a dispatcher worker,
+# nuts: process_message, outbound: waiting for the rate limits, send: ctx.send itself
+STAGES = ("network", "queue", "nuts", "outbound", "send")
+
+current_trace: ContextVar['Trace | None'] = ContextVar('current_trace', default=None)
+
+class Trace():
+
+    __slots__ = ("tracer", "message", "channel", "content", "received", "durations", "pending", "processed")
+
+    def __init__(self, tracer: 'Tracer', message: 'Message'):
+        self.tracer    = tracer
+        self.message   = message
+        self.channel   = message.channel.name
+        self.content   = message.content # process_message rewrites it for commands
+        self.received  = perf_counter_ns()
+        self.durations: dict[str, int] = {}
+        self.pending   = 0 # replies still in the outbound queue
+        self.processed = False
+
+        sent_ts = (message.tags or {}).get('tmi-sent-ts')
+        if sent_ts:
+            # NOTE: wall clocks, twitch's and ours, clamp the skew
+            self.record("network", max(0, time_ns() - int(sent_ts) * 1_000_000))
+
+    def record(self, stage: str, ns: int):
+        # several replies per message, keep the slowest
+        if ns > self.durations.get(stage, -1):
+            self.durations[stage] = ns
+        self.tracer.observe(self.channel, stage, ns)
+
+    def release(self):
+        self.pending -= 1
+        self.settle()
+
+    def settle(self):
+        if self.processed and self.pending <= 0:
+            self.tracer.finish(self)
+
+class Tracer():
+    """Per message spans, aggregated per channel.
+
+    Every message gets a Trace when it arrives; stages are recorded into rolling
+    histograms for its channel and for all channels together. Traces slower than
+    ``slow_ms`` end to end are kept to be appended to ``file``.
+    """
+
+    ALL = '*'
+
+    def __init__(self, config: dict = None):
+        config = config or {}
+        self.slow_ns = int(config.get('slow_ms', 2_000) * 1e6)
+        self.file    = config.get('file')
+        self.window  = config.get('window', 300)
+
+        self._histograms: dict[str, dict[str, RollingHistogram]] = {}
+        self._slow = deque(maxlen=config.get('max_samples', 100)) # json lines waiting to be written
+        self.slow = 0
+
+    def begin(self, message: 'Message') -> Trace:
+        return Trace(self, message)
+
+    def observe(self, channel: str, stage: str, ns: int):
+        now = perf_counter_ns()
+        for key in (channel, self.ALL):
+            histograms = self._histograms.get(key)
+            if histograms is None:
+                histograms = self._histograms[key] = {stage: RollingHistogram(self.window) for stage in STAGES}
+            histograms[stage].record(ns, now)
+
+    def finish(self, trace: Trace):
+        total = sum(trace.durations.values())
+        if total < self.slow_ns:
+            return
+        self.slow += 1
+        self._slow.append(json.dumps({
+            'ts': time_ns() // 1_000_000,
+            'channel': trace.channel,
+            'author': trace.message.author.name if trace.message.author else None,
+            'content': trace.content[:100],
+            'total_ms': total / 1e6,
+            **{f"{stage}_ms": ns / 1e6 for stage, ns in trace.durations.items()},
+        }))
+
+    def percentiles(self, channel: str, *quantiles: float) -> dict[str, list[float]] | None:
+        histograms = self._histograms.get(channel)
+        if histograms is None:
+            return None
+        return {stage: histograms[stage].percentiles(*quantiles) for stage in STAGES}
+
+    def drain_slow(self) -> list[str]:
+        lines = list(self._slow)
+        self._slow.clear()
+        return lines
+
+def append_lines(path: str, lines: list[str]):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
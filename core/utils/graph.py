@@ -1,5 +1,5 @@
-import numpy as np
-from scipy.interpolate import interp1d
+from functools import lru_cache
+from math import floor
 
 
 _graph_characters = [
@@ -9,21 +9,51 @@ _graph_characters = [
     '⡆⣆⣦⣶⣾',
     '⡇⣇⣧⣷⣿']
 
-def generate_graph_string(data: list, characters: int = 12, cbfmt = lambda x: x):
+def resample_linear(data: tuple, points: int) -> list[float]:
+    # same as the interp1d + linspace we used to do
+    last = len(data) - 1
+    if last == 0:
+        return [data[0]] * points
+    result = []
+    for i in range(points):
+        x = i * last / (points - 1)
+        left = min(int(x), last - 1)
+        frac = x - left
+        result.append(data[left] + (data[left + 1] - data[left]) * frac)
+    return result
+
+def resample_minmax(data: tuple, characters: int) -> list[float]:
+    # every character covers a bucket and draws its min and max in time order, spikes never vanish
+    size = len(data)
+    result = []
+    for i in range(characters):
+        bucket = data[i * size // characters:(i + 1) * size // characters]
+        low  = min(bucket)
+        high = max(bucket)
+        result.extend((low, high) if bucket.index(low) <= bucket.index(high) else (high, low))
+    return result
+
+@lru_cache(maxsize=64)
+def _render(data: tuple, characters: int, minmax: bool, cbfmt) -> str:
     up = max(data)
     down = min(data)
 
-    if len(data) == characters * 2:
-        new_data = np.array(data)
+    points = characters * 2
+    if len(data) == points:
+        new_data = data
+    elif minmax and len(data) > points:
+        new_data = resample_minmax(data, characters)
     else:
-        f = interp1d(np.arange(len(data)), np.array(data))
-        points = np.linspace(0, len(data) - 1, characters * 2)
-        new_data = f(points)
+        new_data = resample_linear(data, points)
 
-    new_data = ((new_data - down) / (up - down + 1e-6)) * 5
-    new_data = np.clip(np.floor(new_data), 0, 4)
+    scale = 5 / (up - down + 1e-6)
+    levels = [min(4, max(0, floor((x - down) * scale))) for x in new_data]
 
-    it = iter(new_data)
-    graph = ''.join([_graph_characters[int(x)][int(y)] for x, y in zip(it,it)])
+    it = iter(levels)
+    graph = ''.join([_graph_characters[x][y] for x, y in zip(it, it)])
 
     return f"{cbfmt(down)}⇣[{graph}]⇡{cbfmt(up)}"
+
+def generate_graph_string(data: list, characters: int = 12, cbfmt = lambda x: x, minmax: bool = True):
+    # NOTE: cached on the data itself, redrawing unchanged history is a dict lookup
+    return _render(tuple(data), characters, minmax, cbfmt)
@@ -0,0 +1,51 @@
+from bisect import bisect, insort
+from hashlib import blake2b
+
+def stable_hash(key: str) -> int:
+    # WHY: hash() is salted per process, every shard has to agree on the ring
+    return int.from_bytes(blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+class HashRing():
+    """Consistent hash ring, every node owns ``replicas`` points on it.
+
+    Adding or removing a node only moves the keys between it and its
+    neighbours, about 1/n of them, the rest keep their owner.
+    """
+
+    def __init__(self, nodes: list[str] = (), replicas: int = 64):
+        self.replicas = replicas
+        self._points: list[int] = []
+        self._owners: dict[int, str] = {}
+        self.nodes: set[str] = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.replicas):
+            point = stable_hash(f"{node}#{i}")
+            self._owners[point] = node
+            insort(self._points, point)
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        for i in range(self.replicas):
+            point = stable_hash(f"{node}#{i}")
+            if self._owners.pop(point, None) is not None:
+                self._points.remove(point)
+
+    def node(self, key: str) -> str | None:
+        if not self._points:
+            return None
+        i = bisect(self._points, stable_hash(key)) % len(self._points)
+        return self._owners[self._points[i]]
+
+    def partition(self, keys: list[str]) -> dict[str, list[str]]:
+        partitions = {node: [] for node in self.nodes}
+        for key in keys:
+            partitions[self.node(key)].append(key)
+        return partitions
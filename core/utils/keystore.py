@@ -0,0 +1,67 @@
+import asyncio
+import heapq
+import time
+
+class InProcessKeyStore():
+    """Stand-in for the subset of ``redis.asyncio.Redis`` the bot uses.
+
+    Keys live in this process only, which is enough to run the shared code paths
+    on a single bot or to point several components at the same store locally.
+    """
+
+    def __init__(self):
+        self._data: dict[str, tuple[bytes, float | None]] = {} # key -> (value, monotonic expiry)
+        self._expiries: list[tuple[float, str]] = [] # heap, may hold stale entries for keys set again since
+        self._lock = asyncio.Lock()
+
+    def _alive(self, name: str, now: float) -> bool:
+        entry = self._data.get(name)
+        if entry is None:
+            return False
+        if entry[1] is not None and entry[1] <= now:
+            del self._data[name]
+            return False
+        return True
+
+    def _sweep(self, now: float):
+        # WHY: most keys (cooldowns) are never read again once they expire
+        while self._expiries and self._expiries[0][0] <= now:
+            expiry, name = heapq.heappop(self._expiries)
+            entry = self._data.get(name)
+            if entry is not None and entry[1] == expiry:
+                del self._data[name]
+
+    async def set(self, name: str, value, ex: float = None, px: int = None, nx: bool = False) -> bool | None:
+        async with self._lock:
+            now = time.monotonic()
+            self._sweep(now)
+            if nx and self._alive(name, now):
+                return None
+            expiry = None
+            if px is not None:
+                expiry = now + px / 1000
+            elif ex is not None:
+                expiry = now + ex
+            self._data[name] = (str(value).encode() if not isinstance(value, bytes) else value, expiry)
+            if expiry is not None:
+                heapq.heappush(self._expiries, (expiry, name))
+            return True
+
+    async def get(self, name: str) -> bytes | None:
+        if not self._alive(name, time.monotonic()):
+            return None
+        return self._data[name][0]
+
+    async def delete(self, *names: str) -> int:
+        return sum(self._data.pop(name, None) is not None for name in names)
+
+    async def close(self):
+        self._data.clear()
+        self._expiries.clear()
+
+def connect_keystore(url: str):
+    # NOTE: 'memory://' gives the in process stand-in, anything else goes to redis
+    if url == 'memory://':
+        return InProcessKeyStore()
+    from redis import asyncio as aioredis
+    return aioredis.from_url(url)
@@ -0,0 +1,72 @@
+from typing import Callable, Generic, Iterator, TypeVar
+from collections import OrderedDict
+import time
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+class LRUStore(Generic[K, V]):
+    """Bounded mapping that forgets the least recently used entries.
+
+    Entries idle for longer than ``idle_ttl`` seconds are swept as well, at most
+    once every ``sweep_every`` seconds. Missing entries are rebuilt with ``factory``.
+    """
+
+    def __init__(self, capacity: int, idle_ttl: float, factory: Callable[[K], V], sweep_every: float = 60):
+        self.capacity    = capacity
+        self.idle_ttl    = idle_ttl
+        self.sweep_every = sweep_every
+        self._factory    = factory
+
+        self._items: OrderedDict[K, tuple[V, float]] = OrderedDict()
+        self._last_sweep = time.monotonic()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._items
+
+    def items(self) -> Iterator[tuple[K, V]]:
+        for key, (value, _) in self._items.items():
+            yield key, value
+
+    def get(self, key: K) -> V:
+        now = time.monotonic()
+        entry = self._items.get(key)
+        if entry is None:
+            value = self._factory(key) # rehydrate
+            if len(self._items) >= self.capacity:
+                self._items.popitem(last=False)
+                self.evictions += 1
+        else:
+            value = entry[0]
+            self._items.move_to_end(key)
+        self._items[key] = (value, now)
+
+        if now - self._last_sweep > self.sweep_every:
+            self.sweep(now)
+        return value
+
+    def peek(self, key: K) -> V | None:
+        entry = self._items.get(key)
+        return None if entry is None else entry[0]
+
+    def pop(self, key: K) -> V | None:
+        entry = self._items.pop(key, None)
+        return None if entry is None else entry[0]
+
+    def sweep(self, now: float = None) -> int:
+        now = now or time.monotonic()
+        self._last_sweep = now
+        evicted = 0
+        # NOTE: oldest first, so stop at the first entry that is still fresh
+        while self._items:
+            key, (_, last_seen) = next(iter(self._items.items()))
+            if now - last_seen <= self.idle_ttl:
+                break
+            del self._items[key]
+            evicted += 1
+        self.evictions += evicted
+        return evicted
@@ -0,0 +1,129 @@
+from time import perf_counter_ns
+import os
+
+from core.nut.result import ECODE
+
+SUB_BUCKETS = 8 # per power of two, ~12% resolution
+
+def bucket_of(ns: int) -> int:
+    exp = ns.bit_length()
+    if exp <= 3:
+        return ns
+    return (exp - 3) * SUB_BUCKETS + ((ns >> (exp - 4)) & 7)
+
+def bucket_upper(bucket: int) -> int:
+    # upper bound (ns) of the values that land in bucket
+    if bucket < SUB_BUCKETS:
+        return bucket
+    exp, sub = divmod(bucket, SUB_BUCKETS)
+    return ((SUB_BUCKETS + sub + 1) << (exp - 1)) - 1
+
+class RollingHistogram():
+    """Log bucketed latency histogram covering the last one to two ``window`` seconds.
+
+    Recording is a bit_length and a dict increment. Two windows are kept and
+    rotated, percentiles are read from both.
+    """
+
+    __slots__ = ("window", "_current", "_previous", "_rotate_at")
+
+    def __init__(self, window: float = 300):
+        self.window     = int(window * 1e9)
+        self._current:  dict[int, int] = {}
+        self._previous: dict[int, int] = {}
+        self._rotate_at = perf_counter_ns() + self.window
+
+    def record(self, ns: int, now: int):
+        if now >= self._rotate_at:
+            # NOTE: idle for more than a whole window, the current one is stale too
+            self._previous  = self._current if now < self._rotate_at + self.window else {}
+            self._current   = {}
+            self._rotate_at = now + self.window
+        bucket = bucket_of(ns)
+        self._current[bucket] = self._current.get(bucket, 0) + 1
+
+    def merged(self) -> dict[int, int]:
+        if perf_counter_ns() >= self._rotate_at + self.window:
+            return {}
+        merged = dict(self._previous) if perf_counter_ns() < self._rotate_at else {}
+        for bucket, count in self._current.items():
+            merged[bucket] = merged.get(bucket, 0) + count
+        return merged
+
+    def percentiles(self, *quantiles: float) -> list[float]:
+        # seconds, 0 when nothing was recorded recently
+        merged = self.merged()
+        total  = sum(merged.values())
+        if total == 0:
+            return [0 for _ in quantiles]
+        results = []
+        buckets = sorted(merged.items())
+        for quantile in quantiles:
+            rank, seen = quantile * total, 0
+            for bucket, count in buckets:
+                seen += count
+                if seen >= rank:
+                    results.append(bucket_upper(bucket) / 1e9)
+                    break
+        return results
+
+    def count(self) -> int:
+        return sum(self.merged().values())
+
+class NutMetrics():
+
+    registry: dict[str, 'NutMetrics'] = {}
+
+    __slots__ = ("fullname", "latency", "codes", "total_ns", "calls")
+
+    def __init__(self, fullname: str, window: float = 300):
+        self.fullname = fullname
+        self.latency  = RollingHistogram(window)
+        self.codes    = {code: 0 for code in ECODE}
+        self.total_ns = 0 # since startup
+        self.calls    = 0
+
+    @classmethod
+    def of(cls, fullname: str) -> 'NutMetrics':
+        metrics = cls.registry.get(fullname)
+        if metrics is None:
+            metrics = cls.registry[fullname] = cls(fullname)
+        return metrics
+
+    def record(self, code: ECODE, start: int):
+        now = perf_counter_ns()
+        self.latency.record(now - start, now)
+        self.codes[code] += 1
+        self.total_ns += now - start
+        self.calls += 1
+
+    @property
+    def failures(self) -> int:
+        return self.codes[ECODE.ERROR] + self.codes[ECODE.UNCAUGHT] + self.codes[ECODE.MALFORMED]
+
+def prometheus_text() -> str:
+    lines = [
+        "# HELP dtpbot_nut_latency_seconds Nut actuation latency over the last rolling window.",
+        "# TYPE dtpbot_nut_latency_seconds summary",
+    ]
+    for fullname, metrics in NutMetrics.registry.items():
+        p50, p95, p99 = metrics.latency.percentiles(0.5, 0.95, 0.99)
+        for quantile, value in (("0.5", p50), ("0.95", p95), ("0.99", p99)):
+            lines.append(f'dtpbot_nut_latency_seconds{{nut="{fullname}",quantile="{quantile}"}} {value:.9f}')
+        lines.append(f'dtpbot_nut_latency_seconds_sum{{nut="{fullname}"}} {metrics.total_ns / 1e9:.9f}')
+        lines.append(f'dtpbot_nut_latency_seconds_count{{nut="{fullname}"}} {metrics.calls}')
+    lines += [
+        "# HELP dtpbot_nut_results_total Nut actuations by result code.",
+        "# TYPE dtpbot_nut_results_total counter",
+    ]
+    for fullname, metrics in NutMetrics.registry.items():
+        for code, count in metrics.codes.items():
+            lines.append(f'dtpbot_nut_results_total{{nut="{fullname}",code="{code.name.lower()}"}} {count}')
+    return '\n'.join(lines) + '\n'
+
+def write_atomic(path: str, text: str):
+    # NOTE: scrapers must never see a half written file
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
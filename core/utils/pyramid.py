@@ -0,0 +1,113 @@
+from enum import IntEnum
+import sys
+
+class STEP(IntEnum):
+    RESET    = 0 # nothing going on
+    BROKEN   = 1 # a pyramid tall enough was interrupted by another chatter
+    STARTED  = 2 # second level detected
+    UP       = 3
+    DOWN     = 4
+    COMPLETE = 5 # back down to one, pyramid finished
+
+# NOTE: enum attribute lookups are not free and feed() runs on every chat message
+_RESET, _BROKEN, _STARTED, _UP, _DOWN, _COMPLETE = STEP
+
+def count_tokens(message: str) -> dict[str, int]:
+    counts = {}
+    for token in message.split(" "):
+        counts[token] = counts.get(token, 0) + 1
+    return counts
+
+def count_token(message: str, token: str) -> int:
+    # whole space separated occurrences only, so 'Kappa' does not count inside 'KappaPride'
+    # NOTE: token comes out of count_tokens(), so never contains a space
+    size = len(token)
+    if size == 0:
+        return 0
+    end = len(message)
+    # NOTE: fast path, the message is exactly "token token ... token"
+    repeats, rest = divmod(end + 1, size + 1)
+    if rest == 0 and message.endswith(token) and message.count(token + ' ') == repeats - 1:
+        return repeats
+    occurrences = 0
+    i = message.find(token)
+    while i != -1:
+        after = i + size
+        if (i == 0 or message[i - 1] == ' ') and (after == end or message[after] == ' '):
+            occurrences += 1
+        i = message.find(token, after)
+    return occurrences
+
+class PyramidDetector():
+    """Per channel pyramid tracker, fed one chat message at a time.
+
+    The previous message is only counted once two messages in a row come from the
+    same chatter, and its counts are kept for the next one instead of recounting.
+    Once a pyramid is going just its token is counted.
+    """
+
+    __slots__ = ("last_user", "last_message", "last_counts", "level", "max_level", "pyramid", "last_fact", "finished")
+
+    def __init__(self, channel: str = None):
+        self.last_fact = None
+        self.finished: tuple[str, int, str] = None # (user, level, pyramid) of the last BROKEN/COMPLETE
+        self.reset('', '')
+
+    def reset(self, user: str, message: str, counts: dict[str, int] = None):
+        self.last_user    = user
+        self.last_message = message
+        self.last_counts  = counts
+        self.level        = 0
+        self.max_level    = 0
+        self.pyramid      = ''
+
+    def feed(self, user: str, message: str, req_level: int) -> STEP:
+        # different chatter
+        if user != self.last_user:
+            step = _RESET
+            if self.max_level >= req_level:
+                self.finished = (self.last_user, self.max_level, self.pyramid)
+                step = _BROKEN
+            self.reset(user, message)
+            return step
+
+        # try to detect pyramid if no ongoing pyramid
+        if self.level == 0:
+            new_counts = count_tokens(message)
+            old_counts = self.last_counts or count_tokens(self.last_message)
+            for token, occurrences in new_counts.items():
+                # NOTE: DETECTED PYRAMID at lvl 2
+                if occurrences == 2 and old_counts.get(token) == 1:
+                    self.level = self.max_level = 2
+                    self.pyramid = token
+                    self.last_message = message
+                    self.last_counts  = None # not needed until the pyramid is over
+                    return _STARTED
+            self.reset(user, message, new_counts)
+            return _RESET
+
+        occurrences = count_token(message, self.pyramid)
+        dif = occurrences - self.level
+
+        # pyramid goes up by one (and was at highest point)
+        if dif == 1 and self.level == self.max_level:
+            self.level = self.max_level = occurrences
+            return _UP
+
+        # pyramid goes down by one (and achieved required max height)
+        if dif == -1 and self.max_level >= req_level:
+            self.level = occurrences
+            if occurrences == 1: # at bottom (successful)
+                self.finished = (user, self.max_level, self.pyramid)
+                self.reset(user, message)
+                return _COMPLETE
+            return _DOWN
+
+        self.reset(user, message)
+        return _RESET
+
+    def memory(self) -> int:
+        size = sys.getsizeof(self) + sum(sys.getsizeof(getattr(self, x)) for x in self.__slots__)
+        if self.last_counts:
+            size += sum(sys.getsizeof(x) for x in self.last_counts)
+        return size
@@ -0,0 +1,86 @@
+from typing import Awaitable, Callable
+import asyncio
+import contextvars
+import json
+
+from core.utils.logger import get_log
+from core.utils.keystore import InProcessKeyStore
+
+logging = get_log(__name__)
+
+Callback = Callable[[dict], Awaitable]
+
+class InProcessState():
+    """Keys and topics shared by everything in this process.
+
+    Enough for a single bot and for tests, several processes need ``RedisState``.
+    """
+
+    def __init__(self, prefix: str = "dtpbot:"):
+        self.prefix = prefix
+        self.keys = InProcessKeyStore()
+        self._callbacks: dict[str, list[Callback]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def subscribe(self, topic: str, callback: Callback):
+        self._callbacks.setdefault(self.prefix + topic, []).append(callback)
+
+    async def publish(self, topic: str, payload: dict):
+        # NOTE: delivered as tasks like a remote message would be, outside the publisher's call and context
+        for callback in self._callbacks.get(self.prefix + topic, []):
+            task = asyncio.get_running_loop().create_task(_deliver(callback, payload), context=contextvars.Context())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def close(self):
+        self._callbacks.clear()
+        await self.keys.close()
+
+class RedisState():
+    """Same as ``InProcessState`` over redis, keys are plain keys and topics are pub/sub channels."""
+
+    def __init__(self, url: str, prefix: str = "dtpbot:"):
+        from redis import asyncio as aioredis
+        self.prefix = prefix
+        self.keys = aioredis.from_url(url)
+        self._pubsub = self.keys.pubsub()
+        self._callbacks: dict[str, list[Callback]] = {}
+        self._task: asyncio.Task = None
+
+    async def subscribe(self, topic: str, callback: Callback):
+        name = self.prefix + topic
+        if name not in self._callbacks:
+            await self._pubsub.subscribe(name)
+        self._callbacks.setdefault(name, []).append(callback)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+
+    async def publish(self, topic: str, payload: dict):
+        await self.keys.publish(self.prefix + topic, json.dumps(payload))
+
+    async def _listen(self):
+        async for message in self._pubsub.listen():
+            if message['type'] != 'message':
+                continue
+            payload = json.loads(message['data'])
+            for callback in self._callbacks.get(message['channel'].decode(), []):
+                await _deliver(callback, payload)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self._pubsub.aclose()
+        await self.keys.aclose()
+
+async def _deliver(callback: Callback, payload: dict):
+    try:
+        await callback(payload)
+    except Exception:
+        logging.exception(f"shared state callback failed on {payload}")
+
+def connect_state(url: str, prefix: str = "dtpbot:") -> InProcessState | RedisState:
+    # NOTE: 'memory://' keeps everything in this process, anything else goes to redis
+    if url == 'memory://':
+        return InProcessState(prefix)
+    return RedisState(url, prefix)
@@ -0,0 +1,38 @@
+from contextlib import contextmanager
+from time import perf_counter
+import datetime as dt
+
+from core.utils.logger import get_log
+
+logging = get_log(__name__)
+
+class StartupTimeline():
+    """Named startup phases and how long each one took.
+
+    Phases may overlap (they are measured independently), ``marks`` are
+    moments counted from the process start, like being ready or the first reply.
+    """
+
+    def __init__(self):
+        self.started  = perf_counter()
+        self.started_at = dt.datetime.now()
+        self.phases: dict[str, float] = {} # name -> seconds
+        self.marks: dict[str, float] = {}  # name -> seconds since start
+
+    @contextmanager
+    def phase(self, name: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = perf_counter() - start
+            logging.info(f"startup phase <{name}> took {self.phases[name] * 1000:.0f}ms")
+
+    def mark(self, name: str):
+        # only the first time counts, e.g. the first reply after a deploy
+        if name not in self.marks:
+            self.marks[name] = perf_counter() - self.started
+            logging.info(f"startup <{name}> after {self.marks[name]:.2f}s")
+
+# NOTE: created on first import of this module, as close to the process start as we get
+timeline = StartupTimeline()
@@ -0,0 +1,151 @@
+from array import array
+from typing import BinaryIO
+import json
+import math
+import os
+import time
+
+from core.utils.logger import get_log
+
+logging = get_log(__name__)
+
+class Tier():
+    """Fixed size ring of (min, max, sum, count) buckets of ``resolution`` seconds."""
+
+    __slots__ = ("resolution", "size", "buckets", "mins", "maxs", "sums", "counts")
+
+    def __init__(self, resolution: int, span: int):
+        self.resolution = resolution
+        self.size       = span // resolution
+        self.buckets = array('q', [-1]) * self.size # absolute bucket number held by each slot
+        self.mins    = array('d', [0.0]) * self.size
+        self.maxs    = array('d', [0.0]) * self.size
+        self.sums    = array('d', [0.0]) * self.size
+        self.counts  = array('L', [0]) * self.size
+
+    @property
+    def span(self) -> int:
+        return self.resolution * self.size
+
+    def add(self, ts: float, value: float):
+        bucket = int(ts // self.resolution)
+        slot = bucket % self.size
+        if self.buckets[slot] != bucket: # slot still holds an older lap
+            self.buckets[slot] = bucket
+            self.mins[slot] = self.maxs[slot] = self.sums[slot] = value
+            self.counts[slot] = 1
+            return
+        if value < self.mins[slot]:
+            self.mins[slot] = value
+        if value > self.maxs[slot]:
+            self.maxs[slot] = value
+        self.sums[slot] += value
+        self.counts[slot] += 1
+
+    def query(self, start: float, end: float) -> list[tuple[float, float, float, float]]:
+        # (bucket start, min, avg, max) of the non empty buckets in [start, end], oldest first
+        first = max(int(start // self.resolution), int(end // self.resolution) - self.size + 1)
+        last  = int(end // self.resolution)
+        points = []
+        for bucket in range(first, last + 1):
+            slot = bucket % self.size
+            if self.buckets[slot] == bucket and self.counts[slot]:
+                points.append((bucket * self.resolution, self.mins[slot], self.sums[slot] / self.counts[slot], self.maxs[slot]))
+        return points
+
+    def arrays(self) -> tuple[array, ...]:
+        return (self.buckets, self.mins, self.maxs, self.sums, self.counts)
+
+class Series():
+
+    __slots__ = ("name", "tiers")
+
+    def __init__(self, name: str, tiers: list[tuple[int, int]]):
+        self.name  = name
+        self.tiers = [Tier(resolution, span) for resolution, span in tiers]
+
+    def add(self, value: float, ts: float = None):
+        ts = time.time() if ts is None else ts
+        for tier in self.tiers:
+            tier.add(ts, value)
+
+    def query(self, window: float, end: float = None) -> tuple[int, list[tuple[float, float, float, float]]]:
+        # finest tier that covers the whole window, returns (resolution, points)
+        end = time.time() if end is None else end
+        tier = next((tier for tier in self.tiers if tier.span >= window), self.tiers[-1])
+        return tier.resolution, tier.query(end - window, end)
+
+class MetricStore():
+    """Numeric ring buffers at several resolutions, 1s for 10min, 1m for 2d and 1h for 90d by default.
+
+    Samples go to every tier, each bucket keeps min/max/avg. ``save``/``load``
+    write the raw arrays to a file so history survives restarts.
+    """
+
+    DEFAULT_TIERS = [(1, 600), (60, 2 * 86_400), (3_600, 90 * 86_400)]
+
+    def __init__(self, tiers: list[tuple[int, int]] = None):
+        self.tiers = tiers or self.DEFAULT_TIERS
+        self.series: dict[str, Series] = {}
+
+    def __getitem__(self, name: str) -> Series:
+        series = self.series.get(name)
+        if series is None:
+            series = self.series[name] = Series(name, self.tiers)
+        return series
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.series
+
+    def add(self, name: str, value: float, ts: float = None):
+        if value is None or math.isnan(value):
+            return
+        self[name].add(value, ts)
+
+    def dump(self) -> bytes:
+        # NOTE: built on the loop thread, only the returned bytes go to the writer thread
+        header = {'tiers': self.tiers, 'series': list(self.series)}
+        chunks = [json.dumps(header).encode() + b'\n']
+        for series in self.series.values():
+            for tier in series.tiers:
+                chunks.extend(arr.tobytes() for arr in tier.arrays())
+        return b''.join(chunks)
+
+    def save(self, path: str, data: bytes = None):
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(self.dump() if data is None else data)
+        os.replace(tmp, path)
+
+    def read(self, path: str) -> dict[str, Series] | None:
+        # NOTE: fills new series and never touches the live ones, safe to run off the loop
+        if not os.path.exists(path):
+            return None
+        series = {}
+        try:
+            with open(path, 'rb') as f:
+                header = json.loads(f.readline())
+                if [tuple(x) for x in header['tiers']] != [tuple(x) for x in self.tiers]:
+                    return None # layout changed, start over
+                for name in header['series']:
+                    loaded = series[name] = Series(name, self.tiers)
+                    for tier in loaded.tiers:
+                        for arr in tier.arrays():
+                            self._read_into(f, arr)
+        except (OSError, ValueError, KeyError, TypeError, EOFError) as e:
+            logging.warning(f"metric history {path} is unreadable, ignoring it: {e!r}")
+            return None
+        return series
+
+    def load(self, path: str) -> bool:
+        series = self.read(path)
+        if series is None:
+            return False
+        self.series.update(series)
+        return True
+
+    @staticmethod
+    def _read_into(f: BinaryIO, arr: array):
+        size = len(arr)
+        del arr[:]
+        arr.fromfile(f, size) # EOFError on a truncated file, the series is thrown away
@@ -1,4 +1,5 @@
 import datetime as dt
+import re
 
 TIME_CONSTANTS = {'w': 604_800, 'd': 86_400, 'h': 3_600, 'm': 60, 's': 1, 'ms': 0.001, 'μs': 0.000_001}
 BYTE_CONSTANTS = {'tb': 1_024**4, 'gb': 1_024**3, 'mb': 1_024**2, 'kb': 1_024, 'b': 1}
@@ -8,6 +9,16 @@ def strfdelta(tdelta: dt.timedelta | float, max_units: int = 3, stop = 'ms', las
         tdelta = tdelta.total_seconds()
     return auto_ripper(tdelta, TIME_CONSTANTS, max_units, stop, last_decimals, sep)
 
+_delta_re = re.compile(r"(\d+(?:\.\d+)?)(ms|μs|w|d|h|m|s)")
+
+def strpdelta(text: str) -> float:
+    # '2h30m' -> 9000.0 seconds
+    text = text.strip().lower()
+    parts = _delta_re.findall(text)
+    if not parts or ''.join(value + unit for value, unit in parts) != text:
+        raise ValueError(f"invalid duration '{text}'")
+    return sum(float(value) * TIME_CONSTANTS[unit] for value, unit in parts)
+
 def strfbytes(nbytes: int, max_units: int = 1, stop = None, last_decimals = 2, sep=''):
     return auto_ripper(nbytes, BYTE_CONSTANTS, max_units, stop, last_decimals, sep)
 
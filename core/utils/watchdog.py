@@ -0,0 +1,93 @@
+from types import FrameType
+import asyncio
+import threading
+import traceback
+import sys
+import time
+
+from core.utils.logger import get_log
+
+logging = get_log(__name__)
+
+def active_nut(frame: FrameType) -> str | None:
+    # innermost Nut.actuate on the stack, it's the nut that is hogging the loop
+    from core.nut.nut import Nut
+    while frame is not None:
+        if frame.f_code.co_name in ('actuate', '_actuate'):
+            nut = frame.f_locals.get('self')
+            if isinstance(nut, Nut):
+                return nut.fullname
+        frame = frame.f_back
+    return None
+
+class LoopWatchdog():
+    """Measures how late the event loop wakes up a task that sleeps ``interval``.
+
+    A helper thread watches the heartbeat. When the loop has been stuck for more
+    than ``threshold`` seconds it grabs the loop thread's stack, so the blocking
+    call and the nut running it end up in the logs.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.5):
+        self.interval  = interval
+        self.threshold = threshold
+
+        self._beat = time.monotonic()
+        self._loop_thread: int = None
+        self._task: asyncio.Task = None
+        self._thread: threading.Thread = None
+        self._stopped = threading.Event()
+
+        self.lag       = 0   # seconds, latest measure
+        self.max_lag   = 0   # seconds, since the last pop_max()
+        self.stalls    = 0
+        self.last_stall: tuple[str | None, float] = None # (nut, seconds)
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _tick(self):
+        while True:
+            before = time.monotonic()
+            self._beat = before
+            await asyncio.sleep(self.interval)
+            self.lag = max(0, time.monotonic() - before - self.interval)
+            if self.lag > self.max_lag:
+                self.max_lag = self.lag
+
+    def pop_max(self) -> float:
+        lag, self.max_lag = self.max_lag, 0
+        return lag
+
+    def _watch(self):
+        reported = None # beat of the stall already reported
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._beat
+            stuck = time.monotonic() - beat - self.interval
+            if stuck < self.threshold or beat == reported:
+                continue
+            reported = beat
+
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            nut   = active_nut(frame)
+            stack = ''.join(traceback.format_stack(frame))
+            del frame
+
+            self.stalls += 1
+            self.last_stall = (nut, stuck)
+            logging.warning(f"event loop blocked for {stuck:.2f}s+ in nut <{nut or 'none'}>\n{stack}")
@@ -1,7 +1,15 @@
-from core.bot import Bot
-from core.config import CLIENT_ID
+from core.utils.startup import timeline
+
+with timeline.phase("imports"):
+    from core.bot import Bot
+    from core.config import CLIENT_ID, SHARDS
 
 if __name__ == "__main__":
 
-    bot = Bot(CLIENT_ID)
-    bot.run()
+    if SHARDS.get('count', 1) > 1:
+        import asyncio
+        from core.pipeline.sharding import supervise
+        asyncio.run(supervise(CLIENT_ID, SHARDS))
+    else:
+        bot = Bot(CLIENT_ID)
+        bot.run()